@@ -0,0 +1,40 @@
+"""
+Benchmarks the tokenizer on adversarial texts: very long tokens and dense,
+overlapping keyterms. Time per character must not grow with the size of the
+text.
+
+Run it from the root of the repository with `python -m benchmarks.adversarial`.
+"""
+import timeit
+
+from pt_law_parser import _tokenizer
+
+
+CASES = [
+    # a single token, no keyterm
+    ('long token', ('.', ' ', 'n.os'), lambda n: 'x' * n),
+    # a long token that starts every keyterm, ending in one
+    ('long token, keyterm at end', ('.', ' ', 'n.os', 'x.'),
+     lambda n: 'x' * n + '.'),
+    # every '.' waits for 'n.os' to fail
+    ('dense n.os vs .', ('.', 'n.os', 'n.º', '.º'), lambda n: 'n.' * (n // 2)),
+    # every 'a' waits for a longer keyterm made of 'a's to fail
+    ('nested keyterms', ('a', 'a' * 20 + 'b', 'a' * 10 + 'c'),
+     lambda n: 'a' * n),
+]
+
+
+def main():
+    print('%30s %10s %12s' % ('case', 'chars', 'ns/char'))
+    for name, keyterms, text in CASES:
+        tokenizer = _tokenizer.Tokenizer(keyterms)
+        for size in (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6):
+            string = text(size)
+            elapsed = min(timeit.repeat(lambda: tokenizer.spans(string),
+                                        number=1, repeat=3))
+            print('%30s %10d %12.1f' % (name, len(string),
+                                        elapsed / len(string) * 1e9))
+
+
+if __name__ == '__main__':
+    main()
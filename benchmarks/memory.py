@@ -0,0 +1,80 @@
+"""
+Measures the memory taken by expressions: bytes per token and per section, the
+peak RSS of analysing a large publication, and the objects and bytes of a
+document with its paragraphs stored as lists and compactly.
+
+Run it from the root of the repository with `python -m benchmarks.memory`.
+"""
+import gc
+import resource
+import tracemalloc
+
+from pt_law_parser import parser
+from pt_law_parser.analyser import analyse
+from pt_law_parser.expressions import Token, DocumentReference, Paragraph, \
+    Article, TitledDocumentSection, from_json
+
+from benchmarks.parser import managers
+from benchmarks.tokenizer import corpus
+
+
+def per_object(function, count=10000):
+    """
+    Returns the bytes allocated per call of `function`, including the pointer to
+    the result.
+    """
+    strings = [str(i) for i in range(count)]
+    tracemalloc.start()
+    objects = [function(string) for string in strings]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+
+def rss():
+    text = corpus(100)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    document = analyse(parser.parse(text, managers(),
+                                    {' ', '.', ',', '\n', 'n.os', '«', '»'}))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('%30s %8d kB (%d kB before)' % ('peak RSS analysing', peak, before))
+    del document
+
+
+def compact():
+    terms = {' ', '.', ',', '\n', 'n.os', '«', '»'}
+    data = analyse(parser.parse(corpus(5), managers(), terms)).as_json()
+    for name, is_compact in (('document', False), ('compact document', True)):
+        gc.collect()
+        objects = len(gc.get_objects())
+        tracemalloc.start()
+        # with a token per occurrence, as when the interned ones run out
+        document = from_json(data)
+        if is_compact:
+            document.compact()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('%30s %8d objects %6d kB' % (
+            name, len(gc.get_objects()) - objects, size / 1024))
+        del document
+
+
+def main():
+    # first, before the other measurements raise the peak
+    rss()
+
+    parent = Token('Decreto-Lei')
+    for name, function in (
+            ('Token', Token),
+            ('DocumentReference', lambda x: DocumentReference(x, parent)),
+            ('Paragraph', lambda x: Paragraph()),
+            ('TitledDocumentSection',
+             lambda x: TitledDocumentSection(Article(x), Paragraph()))):
+        print('%30s %8.0f bytes' % (name, per_object(function)))
+    compact()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmarks parsing and analysing a real publication.
+
+Run it from the root of the repository with `python -m benchmarks.parser`.
+"""
+import timeit
+
+from pt_law_parser import parser
+from pt_law_parser.analyser import analyse
+from pt_law_parser.observers import DocumentRefObserver, ArticleRefObserver
+
+from benchmarks.tokenizer import corpus, peak_memory
+
+
+def managers():
+    type_names = ['Decreto-Lei', 'Lei', 'Declaração de Rectificação', 'Portaria']
+    return parser.common_managers + [
+        parser.ObserverManager(dict((name, DocumentRefObserver)
+                                    for name in type_names)),
+        parser.ObserverManager(dict((name, ArticleRefObserver)
+                                    for name in ['artigo', 'artigos']))]
+
+
+def short():
+    """
+    Parses many short texts, like most publications (e.g. Portarias).
+    """
+    text = corpus()
+    texts = [text[i:i + 1000] for i in range(0, len(text), 1000)]
+    terms = {' ', '.', ',', '\n', 'n.os', '«', '»'}
+    managers_ = managers()
+    elapsed = min(timeit.repeat(
+        lambda: [parser.parse(text, managers_, terms) for text in texts],
+        number=1, repeat=5))
+    print('%30s %8.1f us/doc' % ('parse (short)', elapsed / len(texts) * 1e6))
+
+
+def main():
+    short()
+    text = corpus(5)
+    terms = {' ', '.', ',', '\n', 'n.os', '«', '»'}
+    managers_ = managers()
+    for name, function in (
+            ('parse', lambda: parser.parse(text, managers_, terms)),
+            ('parse + analyse',
+             lambda: analyse(parser.parse(text, managers_, terms)))):
+        elapsed = min(timeit.repeat(function, number=1, repeat=5))
+        print('%30s %8.1f ms %8.0f kB' % (name, elapsed * 1e3,
+                                          peak_memory(function) / 1024))
+
+
+if __name__ == '__main__':
+    main()
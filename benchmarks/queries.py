@@ -0,0 +1,51 @@
+"""
+Benchmarks the queries done on analysed documents: finding their references
+by walking through them and with the index of the document (`get_doc_refs`),
+and building their table of contents (`html_toc`).
+
+Run it from the root of the repository with `python -m benchmarks.queries`.
+"""
+import timeit
+
+from pt_law_parser.expressions import DocumentReference, from_bytes
+from pt_law_parser.html import html_toc
+
+from benchmarks.serialization import documents
+
+
+def measure(function, document, number, prepare=None):
+    # on copies of `document`, on which `prepare` is called, if given, so that
+    # nothing else is cached from a previous run
+    data = document.to_bytes()
+    copies = []
+
+    def setup():
+        for _ in range(number):
+            copies.append(from_bytes(data))
+            if prepare is not None:
+                prepare(copies[-1])
+
+    return min(timeit.repeat(lambda: function(copies.pop()), setup=setup,
+                             number=number, repeat=5)) / number
+
+
+def main():
+    def get_doc_refs(document):
+        return document.get_doc_refs()
+
+    queries = (
+        ('find_all', lambda x: x.find_all(
+            lambda y: isinstance(y, DocumentReference), True), None),
+        ('get_doc_refs', get_doc_refs, None),
+        ('get_doc_refs (indexed)', get_doc_refs, get_doc_refs),
+        ('html_toc', lambda x: html_toc(x).as_html(), None))
+    print('%10s' % '' + ''.join('%24s' % name for name, _, _ in queries))
+    for name, document in documents():
+        number = 10 if name == 'corpus' else 100
+        print('%10s' % name + ''.join(
+            '%21.3f ms' % (measure(query, document, number, prepare) * 1e3)
+            for _, query, prepare in queries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Compares the binary format (`to_bytes`/`from_bytes`) with both JSON schemas
+(`as_json`/`from_json`): size, and time to encode and decode the test fixtures
+and a large publication; and the time to build the table of contents of them
+from JSON decoded eagerly and lazily.
+
+Run it from the root of the repository with `python -m benchmarks.serialization`.
+"""
+import os.path
+import timeit
+
+from pt_law_parser import parser
+from pt_law_parser.analyser import analyse
+from pt_law_parser.expressions import from_json, from_bytes
+from pt_law_parser.html import html_toc
+
+from benchmarks.parser import managers
+from benchmarks.tokenizer import corpus
+
+
+def documents():
+    terms = {' ', '.', ',', '\n', 'n.os', '«', '»'}
+    managers_ = managers()
+    raw = os.path.join(os.path.dirname(__file__), '..', 'test', 'raw')
+    for name in ('basic', 'clause', 'no_title'):
+        with open(os.path.join(raw, name + '.txt')) as f:
+            yield name, analyse(parser.parse(f.read(), managers_, terms))
+    yield 'corpus', analyse(parser.parse(corpus(5), managers_, terms))
+
+
+def measure(function, number):
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def main():
+    formats = (
+        ('json', lambda x: x.as_json(), from_json),
+        ('compact json', lambda x: x.as_json(compact=True), from_json),
+        ('bytes', lambda x: x.to_bytes(), from_bytes))
+    print('%20s %10s %10s %10s' % ('', 'size', 'encode', 'decode'))
+    for name, document in documents():
+        number = 3 if name == 'corpus' else 100
+        for format_name, encode, decode in formats:
+            data = encode(document)
+            assert decode(data) == document
+            size = len(data.encode('utf-8') if isinstance(data, str) else data)
+            print('%20s %8d B %7.2f ms %7.2f ms' % (
+                name + ' ' + format_name, size,
+                measure(lambda: encode(document), number) * 1e3,
+                measure(lambda: decode(data), number) * 1e3))
+
+    print('\n%20s %10s %10s' % ('toc from json', 'eager', 'lazy'))
+    for name, document in documents():
+        number = 3 if name == 'corpus' else 100
+        data = document.as_json(compact=True)
+        eager = measure(lambda: html_toc(from_json(data)), number)
+        lazy = measure(lambda: html_toc(from_json(data, lazy=True)), number)
+        print('%20s %7.2f ms %7.2f ms' % (name, eager * 1e3, lazy * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Benchmarks tokenizing many publications from a pool of threads. The tokenizer
+releases the GIL while it scans, so throughput should grow with the number of
+threads up to the number of cores; on free-threaded builds, building the tokens
+also runs in parallel.
+
+Run it from the root of the repository with `python -m benchmarks.threads`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from pt_law_parser import _tokenizer
+
+from benchmarks.tokenizer import corpus, keyterms, TERMS
+
+
+def throughput(function, documents, threads):
+    """
+    Returns the number of documents per second `function` processes using
+    `threads` threads.
+    """
+    with ThreadPoolExecutor(threads) as executor:
+        start = time.perf_counter()
+        for _ in executor.map(function, documents):
+            pass
+        return len(documents) / (time.perf_counter() - start)
+
+
+def main():
+    documents = [corpus(5) for _ in range(200)]
+    tokenizer = _tokenizer.Tokenizer(keyterms(len(TERMS)))
+
+    threads = [1]
+    while threads[-1] < (os.cpu_count() or 1):
+        threads.append(min(2 * threads[-1], os.cpu_count()))
+
+    for name, function in (('spans', tokenizer.spans),
+                           ('tokenize', tokenizer.tokenize)):
+        single = throughput(function, documents, 1)
+        print(name)
+        print('%10s %12s %10s' % ('threads', 'docs/s', 'speedup'))
+        for count in threads:
+            docs = throughput(function, documents, count)
+            print('%10d %12.1f %10.2f' % (count, docs, docs / single))
+
+
+if __name__ == '__main__':
+    main()
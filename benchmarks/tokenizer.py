@@ -0,0 +1,134 @@
+"""
+Benchmarks the tokenizer's throughput as the number of keyterms grows.
+
+Run it from the root of the repository with `python -m benchmarks.tokenizer`.
+"""
+import mmap
+import os.path
+import tempfile
+import timeit
+import tracemalloc
+
+from pt_law_parser import _tokenizer
+from pt_law_parser.tokenizer import tokenize, tokenize_spans
+
+
+TERMS = [' ', '.', ',', '\n', 'n.os', '«', '»', 'Diretiva',
+         'Decisão de Execução', 'Regulamento (CE)', 'Regulamento CE',
+         'Regulamento CEE', 'Decreto-Lei', 'Lei', 'Declaração de Rectificação',
+         'Portaria', 'Despacho', 'Resolução', 'Decreto Regulamentar', 'artigo',
+         'artigos']
+
+
+def corpus(repeat=20):
+    """
+    Returns the normalized text of a real publication, repeated `repeat` times.
+    """
+    file_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(file_dir + '/test/expected/67040491_norm.html') as f:
+        return f.read() * repeat
+
+
+def keyterms(count):
+    """
+    Returns `count` keyterms: the real ones followed by made up document types.
+    """
+    terms = TERMS[:count]
+    for i in range(count - len(terms)):
+        terms.append('Documento Tipo %d' % i)
+    return terms
+
+
+def setup():
+    """
+    Compares tokenizing short documents with and without a compiled `Tokenizer`.
+    """
+    text = corpus(1)[:500]
+    texts = [text] * 100
+    terms = keyterms(len(TERMS))
+    tokenizer = _tokenizer.Tokenizer(terms)
+    number = 20
+    for name, function in (
+            ('tokenize(text, keyterms)',
+             lambda: [_tokenizer.tokenize(text, terms) for text in texts]),
+            ('Tokenizer.tokenize(text)',
+             lambda: [tokenizer.tokenize(text) for text in texts]),
+            ('Tokenizer.tokenize_many(texts)',
+             lambda: tokenizer.tokenize_many(texts))):
+        elapsed = min(timeit.repeat(function, number=number, repeat=5))
+        print('%30s %8.1f us/doc' % (name, elapsed / number / len(texts) * 1e6))
+
+
+def scaling():
+    text = corpus()
+    size = len(text.encode('utf-8')) / 2 ** 20
+    print('%10s %12s %12s %12s' % ('keyterms', 'MB/s', 'matches',
+                                   'peak_matches'))
+    for count in (10, 50, 100, 200, 500):
+        tokenizer = _tokenizer.Tokenizer(keyterms(count))
+        elapsed = min(timeit.repeat(lambda: tokenizer.tokenize(text),
+                                    number=1, repeat=5))
+        stats = tokenizer.tokenize(text, stats=True)[1]
+        print('%10d %12.1f %12d %12d' % (count, size / elapsed, stats['matches'],
+                                         stats['peak_matches']))
+
+
+def peak_memory(function):
+    """
+    Returns the peak of memory allocated while running `function`, in bytes.
+    """
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def spans():
+    """
+    Compares `Token`s against spans on a text of the size of large publications.
+    """
+    text = corpus()
+    tokenizer = _tokenizer.Tokenizer(keyterms(len(TERMS)))
+    for name, function in (
+            ('tokenize', lambda: tokenize(text, tokenizer)),
+            ('tokenize_spans', lambda: tokenize_spans(text, tokenizer))):
+        elapsed = min(timeit.repeat(function, number=1, repeat=5))
+        print('%30s %8.1f ms %8.0f kB' % (name, elapsed * 1e3,
+                                          peak_memory(function) / 1024))
+
+
+def buffers():
+    """
+    Compares tokenizing a publication read as `str`, `bytes` and `mmap`.
+    """
+    text = corpus()
+    tokenizer = _tokenizer.Tokenizer(keyterms(len(TERMS)))
+    with tempfile.TemporaryFile() as f:
+        f.write(text.encode('utf-8'))
+        f.flush()
+
+        def read():
+            f.seek(0)
+            return f.read()
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for name, function in (
+                    ('str', lambda: tokenizer.tokenize(read().decode('utf-8'))),
+                    ('bytes', lambda: tokenizer.tokenize(read())),
+                    ('mmap', lambda: tokenizer.tokenize(mapped))):
+                elapsed = min(timeit.repeat(function, number=1, repeat=5))
+                print('%30s %8.1f ms %8.0f kB' % (
+                    name, elapsed * 1e3, peak_memory(function) / 1024))
+
+
+def main():
+    scaling()
+    setup()
+    spans()
+    buffers()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,19 @@
 from pt_law_parser.normalizer import normalize
-from pt_law_parser.parser import parse, common_managers, ObserverManager
+from pt_law_parser.parser import parse, parse_many, common_managers, \
+    ObserverManager
 from pt_law_parser import observers
 import pt_law_parser.analyser
 from pt_law_parser.expressions import from_json
 from pt_law_parser.html import html_toc
 
 
-def analyse(text, managers, terms):
-    return analyser.analyse(parse(normalize(text), managers, terms))
+def analyse(text, managers, terms, tokenizer=None):
+    text = normalize(text)
+    return analyser.analyse(parse(text, managers, terms, tokenizer=tokenizer),
+                            text)
+
+
+def analyse_many(texts, managers, terms, tokenizer=None):
+    texts = [normalize(text) for text in texts]
+    return [analyser.analyse(tokens, text) for tokens, text in
+            zip(parse_many(texts, managers, terms, tokenizer=tokenizer), texts)]
@@ -5,7 +5,8 @@ into a tree structure of sections.
 from pt_law_parser.expressions import Annex, Part, Title, Chapter, Section, \
     SubSection, Article, Number, Line, Item, Paragraph, Anchor, QuotationSection, Clause, \
     Document, InlineParagraph, InlineDocumentSection, TitledDocumentSection, \
-    Token, UnorderedDocumentSection, OrderedDocumentSection
+    UnorderedDocumentSection, OrderedDocumentSection, EMPTY, NEWLINE, \
+    OPEN_QUOTE, CLOSE_QUOTE
 
 hierarchy_order = [
     Annex, Part, Title, Chapter, Section, SubSection, Clause, Article, Number,
@@ -16,29 +17,35 @@ hierarchy_order = [
 single_paragraph_format = {Item}
 
 
-def analyse(tokens):
+def analyse(tokens, text=None):
+    """
+    Returns the `Document` of `tokens`. When they are the tokens of `text` and
+    the document is a lossless view of it, its sections are slices of `text`
+    (see `BaseDocumentSection.span`).
+    """
     root = Document()
     root_parser = HierarchyParser(root)
 
     paragraph = Paragraph()
     block_mode = False
     for token in tokens:
-        if token.as_str() == '':
+        kind = token.kind
+        if kind == EMPTY:
             continue
         # start of quote
-        if token == Token('«') and len(paragraph) == 0:
+        if kind == OPEN_QUOTE and len(paragraph) == 0:
             block_mode = True
             block_parser = HierarchyParser(QuotationSection(), add_links=False)
         # end of quote
-        elif token == Token('»') and len(paragraph) == 0:
+        elif kind == CLOSE_QUOTE and len(paragraph) == 0:
             block_mode = False
             root_parser.add(block_parser.root)
             paragraph = Paragraph()
         # construct the paragraphs
         # paragraph can end by '\n' or by starting a new section.
-        elif isinstance(token, Anchor) or token.string == '\n':
+        elif kind == NEWLINE or isinstance(token, Anchor):
             # it is end of paragraph; complete it if it ends by a normal \n.
-            if token.string == '\n':
+            if kind == NEWLINE:
                 paragraph.append(token)
 
             # select current parser
@@ -62,6 +69,8 @@ def analyse(tokens):
         else:
             paragraph.append(token)
 
+    if text is not None:
+        root._set_source(text)
     return root
 
 
@@ -1,14 +1,41 @@
 """
 Contains all elements of this package. They act as the formal elements of the law.
 """
+from array import array
 import json
+from json.encoder import encode_basestring, encode_basestring_ascii
 import sys
+import threading
 
 
-def from_json(data):
+# How the fields of each class are stored by `to_bytes` and the compact JSON
+_TOKEN, _REFERENCE, _DOCUMENT_REFERENCE, _SECTION, _DOCUMENT_SECTION, \
+    _TITLED_SECTION = range(6)  # the first three are leaves
+
+
+def _layout(klass):
+    for base, layout in ((TitledDocumentSection, _TITLED_SECTION),
+                         (DocumentSection, _DOCUMENT_SECTION),
+                         (BaseDocumentSection, _SECTION),
+                         (DocumentReference, _DOCUMENT_REFERENCE),
+                         (Reference, _REFERENCE),
+                         (Token, _TOKEN)):
+        if issubclass(klass, base):
+            return layout
+    raise TypeError('%s cannot be converted' % klass.__name__)
+
+
+def from_json(data, lazy=False):
     """
-    Reconstructs any `BaseElement` from its own `.as_json()`. Returns the element.
+    Reconstructs any `BaseElement` from its own `.as_json()`, in any of its
+    schemas. Returns the element. With `lazy`, the elements of each section are
+    only constructed when they are first used, e.g. to read the titles of a
+    large document.
     """
+    data = json.loads(data)
+    if 'classes' in data:
+        return _from_compact_json(data, lazy)
+
     def _decode(data_dict):
         values = []
         if isinstance(data_dict, str):
@@ -18,6 +45,9 @@ def from_json(data):
         klass_string = next(iter(data_dict.keys()))
         klass = getattr(sys.modules[__name__], klass_string)
 
+        if lazy and issubclass(klass, BaseDocumentSection):
+            return [_lazy_section(klass, data_dict[klass_string], _decode_one)]
+
         args = []
         for e in data_dict[klass_string]:
             x = _decode(e)
@@ -29,19 +59,314 @@ def from_json(data):
 
         return values
 
-    return _decode(json.loads(data))[0]
+    def _decode_one(data_dict):
+        return _decode(data_dict)[0]
+
+    return _decode_one(data)
+
+
+def _lazy_section(klass, nodes, decode, anchor=None, title=None):
+    """
+    Returns a section of `klass` whose elements are only decoded from `nodes`
+    by `decode` when they are first used (see `BaseDocumentSection._lazy`).
+    Without `anchor`, the anchor and the title, if any, are the first nodes.
+    """
+    layout = _layout(klass)
+    if layout == _SECTION:
+        section = klass()
+    else:
+        if anchor is None:
+            anchor = decode(nodes[0])
+            nodes = nodes[1:]
+            if layout == _TITLED_SECTION and nodes:
+                title = decode(nodes[0])
+                nodes = nodes[1:]
+        if layout == _DOCUMENT_SECTION:
+            section = klass(anchor)
+        else:
+            section = klass(anchor, title)
+    del section._children
+    section._lazy = map(decode, nodes)
+    return section
+
+
+# The compact schema of `BaseElement.as_json`: an object with the `element`, the
+# `classes` whose indexes are used in it, and the `version`. Each element is an
+# array with the index of its class followed by its fields, in one of the
+# layouts of `_layout`:
+# - tokens and anchors: its string, or only the string for a `Token`;
+# - references: its number, its parent or null, and its href, if any;
+# - sections: the index of the class and the number of its anchor, if any, its
+#   title or null, if it can have one, and its elements.
+_JSON_VERSION = 1
+
+
+def _from_compact_json(data, lazy):
+    if data['version'] != _JSON_VERSION:
+        raise ValueError('Version %d of the JSON schema is not supported' %
+                         data['version'])
+    classes = [getattr(sys.modules[__name__], name) for name in data['classes']]
+    classes = [(klass, _layout(klass)) for klass in classes]
+    tokens = {}  # string: `Token`, shared as those from the tokenizer
+
+    def _decode(node):
+        if isinstance(node, str):
+            if node not in tokens:
+                tokens[node] = Token(node)
+            return tokens[node]
+
+        klass, layout = classes[node[0]]
+        if layout == _TOKEN:
+            return klass(node[1])
+        elif layout in (_REFERENCE, _DOCUMENT_REFERENCE):
+            parent = None if node[2] is None else _decode(node[2])
+            return klass(node[1], parent, *node[3:])
+        elif layout == _SECTION:
+            if lazy:
+                return _lazy_section(klass, node[1:], _decode)
+            return klass(*[_decode(child) for child in node[1:]])
+
+        anchor = classes[node[1]][0](node[2])
+        if layout == _DOCUMENT_SECTION:
+            if lazy:
+                return _lazy_section(klass, node[3:], _decode, anchor)
+            return klass(anchor, *[_decode(child) for child in node[3:]])
+        title = None if node[3] is None else _decode(node[3])
+        if lazy:
+            return _lazy_section(klass, node[4:], _decode, anchor, title)
+        return klass(anchor, title, *[_decode(child) for child in node[4:]])
+
+    return _decode(data['element'])
+
+
+# The binary format of `BaseElement.to_bytes`: the magic and the version, the
+# table of the classes and the table of the strings of the element, and the
+# element. Each element is the index of its class followed by its fields, in one
+# of the layouts below:
+# - tokens and anchors: the index of its string;
+# - references: the index of its number, 1 and its parent or 0, and the index
+#   of its href + 1 or 0;
+# - sections: its anchor, 1 if it has a title or 0, and its number of elements
+#   followed by them, the title first.
+# Integers are unsigned LEB128 varints.
+_BYTES_MAGIC = b'PTLP'
+_BYTES_VERSION = 1
+
+def _write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, position):
+    """
+    Returns the varint in `data` at `position` and the position after it.
+    Raises `ValueError` if `data` ends before it.
+    """
+    try:
+        byte = data[position]
+        if byte < 0x80:
+            return byte, position + 1
+        value = byte & 0x7f
+        shift = 7
+        while True:
+            position += 1
+            byte = data[position]
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, position + 1
+            shift += 7
+    except IndexError:
+        raise ValueError('The data is truncated')
+
+
+def _bytes_class(name):
+    """
+    Returns the class of the elements named `name` in `to_bytes` and its
+    layout. Raises `ValueError` if there is none.
+    """
+    classes = [BaseElement]
+    while classes:
+        klass = classes.pop()
+        if klass.__name__ == name and klass.__module__ == __name__:
+            try:
+                return klass, _layout(klass)
+            except TypeError:
+                break
+        classes.extend(klass.__subclasses__())
+    raise ValueError('%r is not a class of elements' % name)
+
+
+def from_bytes(data):
+    """
+    Reconstructs any `BaseElement` from its own `.to_bytes()`. Returns the
+    element. Equal tokens are shared, as those from the tokenizer. Raises
+    `ValueError` if `data` is not a valid output of `to_bytes`.
+    """
+    data = bytes(data)
+    if data[:len(_BYTES_MAGIC)] != _BYTES_MAGIC:
+        raise ValueError('The data was not created by `to_bytes`')
+    version, position = _read_varint(data, len(_BYTES_MAGIC))
+    if version != _BYTES_VERSION:
+        raise ValueError('Version %d of the binary format is not supported' %
+                         version)
+
+    tables = []
+    for _ in range(2):
+        count, position = _read_varint(data, position)
+        table = []
+        for _ in range(count):
+            size, position = _read_varint(data, position)
+            if position + size > len(data):
+                raise ValueError('The data is truncated')
+            table.append(data[position:position + size].decode('utf-8'))
+            position += size
+        tables.append(table)
+    classes = [_bytes_class(name) for name in tables[0]]
+    strings = tables[1]
+    try:
+        return _read_bytes_element(data, position, classes, strings)
+    except IndexError:
+        # of a class, a string or a byte that is not in the data
+        raise ValueError('The data is truncated or corrupted')
+
+
+def _read_bytes_element(data, position, classes, strings):
+    """
+    Reads the element of `from_bytes` that starts at `position` of `data` and
+    ends it.
+    """
+    tokens = {}  # index: `Token`
+
+    def read_leaf(position, layouts=(_TOKEN, _REFERENCE, _DOCUMENT_REFERENCE)):
+        # tokens and references, whose parents are also tokens or references
+        code, position = _read_varint(data, position)
+        klass, layout = classes[code]
+        if layout not in layouts:
+            raise ValueError('%s is not expected here' % klass.__name__)
+        index, position = _read_varint(data, position)
+        if layout == _TOKEN:
+            if klass is not Token:
+                return klass(strings[index]), position
+            if index not in tokens:
+                tokens[index] = Token(strings[index])
+            return tokens[index], position
+
+        parent = None
+        position += 1
+        if data[position - 1]:
+            parent, position = read_leaf(position)
+        if layout == _DOCUMENT_REFERENCE:
+            href, position = _read_varint(data, position)
+            href = strings[href - 1] if href else ''
+            return klass(strings[index], parent, href), position
+        return klass(strings[index], parent), position
+
+    # iterative, with the sections whose elements are being read
+    stack = []  # [class, anchor, title, section, elements left]
+    while True:
+        code, next_position = _read_varint(data, position)
+        klass, layout = classes[code]
+        if klass is Token:  # most elements
+            index, position = _read_varint(data, next_position)
+            element = tokens.get(index)
+            if element is None:
+                element = tokens[index] = Token(strings[index])
+        elif layout < _SECTION:
+            element, position = read_leaf(position)
+        else:
+            position = next_position
+            frame = [klass, None, False, None, 0]
+            if layout != _SECTION:
+                frame[1], position = read_leaf(position, (_TOKEN,))
+                if not isinstance(frame[1], Anchor):
+                    raise ValueError('%s is not an anchor' %
+                                     frame[1].__class__.__name__)
+            if layout == _TITLED_SECTION:
+                frame[2] = bool(data[position])
+                position += 1
+            frame[4], position = _read_varint(data, position)
+            if not frame[2]:
+                frame[3] = klass() if frame[1] is None else klass(frame[1])
+            if frame[4]:
+                stack.append(frame)
+                continue
+            element = frame[3]
+
+        # add the element to its section, and the completed sections to theirs
+        while stack:
+            frame = stack[-1]
+            if frame[3] is None:
+                frame[3] = frame[0](frame[1], element)  # the title
+            elif element.__class__ is Token:
+                # nothing is cached yet, see `append`
+                frame[3]._children.append(element)
+            else:
+                frame[3].append(element)
+            frame[4] -= 1
+            if frame[4]:
+                break
+            element = frame[3]
+            stack.pop()
+        else:
+            if position != len(data):
+                raise ValueError('The data has bytes after its element')
+            return element
+
+
+# Integer kinds of tokens, used to compare them without strings (see
+# `Token.kind`). The structural tokens have fixed kinds; keyterms register theirs
+# with `register_kind`; any other string is `TEXT`.
+TEXT, EMPTY, SPACE, NEWLINE, DOT, COMMA, OPEN_QUOTE, CLOSE_QUOTE = range(8)
+
+_kinds = {'': EMPTY, ' ': SPACE, '\n': NEWLINE, '.': DOT, ',': COMMA,
+          '«': OPEN_QUOTE, '»': CLOSE_QUOTE}
+_kinds_lock = threading.Lock()  # tokenizers are built from any thread
+
+
+def register_kind(string):
+    """
+    Returns the kind of `string`, registering a new one if it has none. Safe to
+    call from several threads: each string gets a single, distinct kind.
+    """
+    kind = _kinds.get(string)
+    if kind is None:
+        with _kinds_lock:
+            kind = _kinds.get(string)
+            if kind is None:
+                kind = _kinds[string] = len(_kinds) + 1
+    return kind
 
 
 class BaseElement(object):
     """
     Defines the interface of all elements.
     """
+    __slots__ = ()
+
+    _CHUNK = 512  # fragments joined in each chunk of `iter_html`/`iter_json`
+
     def as_html(self):
         """
         How the element converts itself to HTML.
         """
         raise NotImplementedError
 
+    def iter_html(self):
+        """
+        Yields `as_html()` in fragments, without building the whole string.
+        """
+        yield self.as_html()
+
+    def write_html(self, sink):
+        """
+        Writes `as_html()` in fragments into `sink`, a list or a file-like object.
+        """
+        write = sink.append if isinstance(sink, list) else sink.write
+        for fragment in self.iter_html():
+            write(fragment)
+
     def as_str(self):
         """
         How the element converts itself to simple text.
@@ -54,41 +379,244 @@ class BaseElement(object):
         """
         raise NotImplementedError
 
-    def as_json(self):
+    def as_json(self, compact=False):
+        """
+        How the element converts itself to JSON: `json.dumps(self.as_dict())`
+        or, with `compact`, a schema with less repetition. `from_json` reads
+        both. Not to be overwritten.
+        """
+        return ''.join(self.iter_json(compact))
+
+    def iter_json(self, compact=False):
+        """
+        Yields `as_json(compact)` in fragments, without building `as_dict()`.
+        Not to be overwritten.
+        """
+        if compact:
+            encode = encode_basestring
+            separator = ','
+        else:
+            encode = encode_basestring_ascii
+            separator = ', '
+        classes = {}  # class: (index, layout)
+
+        def write_class(klass):
+            if klass not in classes:
+                classes[klass] = (len(classes), _layout(klass))
+            return classes[klass]
+
+        def leaf(element):
+            # tokens and references, whose parents are also tokens or references
+            klass = element.__class__
+            index, layout = write_class(klass)
+            if layout == _TOKEN:
+                if not compact:
+                    return '{"%s": [%s]}' % (klass.__name__,
+                                             encode(element.string))
+                elif klass is Token:
+                    return encode(element.string)
+                return '[%d,%s]' % (index, encode(element.string))
+
+            parent = element.parent
+            href = element._href if layout == _DOCUMENT_REFERENCE else None
+            if compact:
+                json = '[%d,%s,%s' % (
+                    index, encode(element.number),
+                    'null' if parent is None else leaf(parent))
+            else:
+                json = '{"%s": [%s' % (klass.__name__, encode(element.number))
+                if parent is not None:
+                    json += ', ' + leaf(parent)
+            if href:
+                json += separator + encode(href)
+            return json + (']' if compact else ']}')
+
+        if compact:
+            yield '{"element":'
+        fragments = []  # not yielded yet, to yield them in chunks
+        write = fragments.append
+        # iterative, in pre-order, with the strings still to write after the
+        # current element
+        stack = [self]
+        while stack:
+            element = stack.pop()
+            if element.__class__ is str:
+                write(element)
+                continue
+            klass = element.__class__
+            index, layout = write_class(klass)
+            if layout < _SECTION:
+                write(leaf(element))
+                continue
+
+            elements = element._elements()
+            if compact:
+                start = '[%d' % index
+                if layout != _SECTION:
+                    anchor = element.anchor
+                    start += ',%d,%s' % (write_class(anchor.__class__)[0],
+                                         encode(anchor.number))
+                if layout == _TITLED_SECTION:
+                    if element.title is None:
+                        start += ',null'
+                    else:
+                        elements = [element.title] + elements
+                stack.append(']')
+            else:
+                start = '{"%s": [' % klass.__name__
+                if layout != _SECTION:
+                    start += leaf(element.anchor)
+                if layout == _TITLED_SECTION and element.title is not None:
+                    elements = [element.title] + elements
+                stack.append(']}')
+            write(start)
+
+            # the first element needs a separator when something precedes it
+            first = 0 if compact or layout != _SECTION else 1
+            for i in range(len(elements) - 1, -1, -1):
+                stack.append(elements[i])
+                if i >= first:
+                    stack.append(separator)
+
+            if len(fragments) >= self._CHUNK:
+                yield ''.join(fragments)
+                del fragments[:]
+        yield ''.join(fragments)
+
+        if compact:
+            yield ',"classes":[%s],"version":%d}' % (
+                ','.join('"%s"' % klass.__name__ for klass in classes),
+                _JSON_VERSION)
+
+    def write_json(self, sink, compact=False):
+        """
+        Writes `as_json(compact)` in fragments into `sink`, a list or a
+        file-like object. Not to be overwritten.
+        """
+        write = sink.append if isinstance(sink, list) else sink.write
+        for fragment in self.iter_json(compact):
+            write(fragment)
+
+    def to_bytes(self):
         """
-        How the element converts itself to JSON. Not to be overwritten.
+        How the element converts itself to bytes, much smaller and faster to
+        read than JSON (see `from_bytes`). Not to be overwritten.
         """
-        return json.dumps(self.as_dict())
+        classes = {}  # class: (index, layout)
+        strings = {}  # string: index
+        body = bytearray()
+
+        def write_class(klass):
+            if klass not in classes:
+                classes[klass] = (len(classes), _layout(klass))
+            index, layout = classes[klass]
+            _write_varint(body, index)
+            return layout
+
+        def write_string(string):
+            if string not in strings:
+                strings[string] = len(strings)
+            _write_varint(body, strings[string])
+
+        def write_leaf(element, layout):
+            # tokens and references, whose parents are also tokens or references
+            write_string(element.string)
+            if layout == _TOKEN:
+                return
+            if element.parent is None:
+                body.append(0)
+            else:
+                body.append(1)
+                parent_layout = write_class(element.parent.__class__)
+                assert(parent_layout in (_TOKEN, _REFERENCE,
+                                         _DOCUMENT_REFERENCE))
+                write_leaf(element.parent, parent_layout)
+            if layout == _DOCUMENT_REFERENCE:
+                if element._href:
+                    if element._href not in strings:
+                        strings[element._href] = len(strings)
+                    _write_varint(body, strings[element._href] + 1)
+                else:
+                    body.append(0)
+
+        # iterative, in pre-order
+        stack = [self]
+        while stack:
+            element = stack.pop()
+            layout = write_class(element.__class__)
+            if layout < _SECTION:
+                write_leaf(element, layout)
+                continue
+
+            elements = element._elements()
+            if layout != _SECTION:
+                assert(write_class(element.anchor.__class__) == _TOKEN)
+                write_leaf(element.anchor, _TOKEN)
+            if layout == _TITLED_SECTION:
+                if element.title is None:
+                    body.append(0)
+                else:
+                    body.append(1)
+                    elements = [element.title] + elements
+            _write_varint(body, len(elements))
+            stack.extend(reversed(elements))
+
+        data = bytearray(_BYTES_MAGIC)
+        _write_varint(data, _BYTES_VERSION)
+        for table in ([klass.__name__ for klass in classes], list(strings)):
+            _write_varint(data, len(table))
+            for string in table:
+                string = string.encode('utf-8')
+                _write_varint(data, len(string))
+                data += string
+        return bytes(data + body)
 
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, repr(self.as_str()))
 
+    def _key(self):
+        """
+        The tuple of values that, with its class, define the element: elements
+        are equal when their classes and keys are.
+        """
+        raise NotImplementedError
+
     def __eq__(self, other):
-        if isinstance(other, self.__class__):
-            return self.as_dict() == other.as_dict()
-        else:
-            return False
+        if self is other:
+            return True
+        return type(other) is type(self) and self._key() == other._key()
 
-    @staticmethod
-    def _build_html(tag, text, attrib):
-        text = text.replace('\n', '')  # \n have no meaning in HTML
-        if not text:
-            # ignore empty elements
-            return ''
+    def __hash__(self):
+        return hash((type(self),) + self._key())
 
+    @staticmethod
+    def _html_start(tag, attrib):
         attributes = ' '.join('%s="%s"' % (key, value)
                               for (key, value) in sorted(attrib.items())
                               if value is not None)
         if attributes:
             attributes = ' ' + attributes
 
-        return '<{0}{1}>{2}</{0}>'.format(tag, attributes, text)
+        return '<{0}{1}>'.format(tag, attributes)
+
+    @staticmethod
+    def _build_html(tag, text, attrib):
+        text = text.replace('\n', '')  # \n have no meaning in HTML
+        if not text:
+            # ignore empty elements
+            return ''
+
+        return '{0}{1}</{2}>'.format(BaseElement._html_start(tag, attrib), text,
+                                     tag)
 
 
 class Token(BaseElement):
     """
-    A simple string.
+    A simple string. Tokens are shared between all the places where the same
+    string occurs (see `tokenizer.intern_token`) and thus must not be changed.
     """
+    __slots__ = ('_string',)
+
     def __init__(self, string):
         assert isinstance(string, str)
         self._string = string
@@ -102,16 +630,29 @@ class Token(BaseElement):
     def as_dict(self):
         return {self.__class__.__name__: [self.as_str()]}
 
+    def _key(self):
+        return self._string,
+
     @property
     def string(self):
         return self._string
 
+    @property
+    def kind(self):
+        """
+        The integer kind of this token: equal tokens have the same kind.
+        """
+        return _kinds.get(self._string, TEXT)
+
 
 class Reference(Token):
     """
     A generic reference to anything. Contains a number (str) and a parent, which
     must be either `None` or a `Token` (or a subclass of `Token`).
     """
+    __slots__ = ('_parent',)
+    kind = TEXT  # never equal to a `Token`
+
     def __init__(self, number, parent=None):
         super(Reference, self).__init__(number)
         assert isinstance(number, str)
@@ -131,6 +672,9 @@ class Reference(Token):
             r[self.__class__.__name__].append(self.parent.as_dict())
         return r
 
+    def _key(self):
+        return self._string, self._parent
+
     @property
     def number(self):
         return self.string
@@ -145,10 +689,12 @@ class DocumentReference(Reference):
     A concrete Reference to a document. Contains an href that identifies where
     it points to, as well as a `set_href` to set it.
     """
+    __slots__ = ('_href', '_parent_section')
 
     def __init__(self, number, parent, href=''):
         super(DocumentReference, self).__init__(number, parent)
         self._href = href
+        self._parent_section = None  # the section it was appended to
 
     def __repr__(self):
         return '<%s %s %s>' % (self.__class__.__name__, repr(self.as_str()),
@@ -160,6 +706,8 @@ class DocumentReference(Reference):
 
     def set_href(self, href):
         self._href = href
+        if self._parent_section is not None:
+            self._parent_section._invalidate(text=False)
 
     def as_html(self):
         if self._href:
@@ -172,23 +720,28 @@ class DocumentReference(Reference):
             r[self.__class__.__name__].append(self._href)
         return r
 
+    def _key(self):
+        return self._string, self._parent, self._href or ''
+
 
 class LineReference(Reference):
-    pass
+    __slots__ = ()
 
 
 class NumberReference(Reference):
-    pass
+    __slots__ = ()
 
 
 class ArticleReference(Reference):
-    pass
+    __slots__ = ()
 
 
 class EULawReference(Reference):
     """
     A reference to EU law. Its href is built from its name and number.
     """
+    __slots__ = ()
+
     @staticmethod
     def _build_eu_url(name, number):
         # example: '2000/29/CE'
@@ -220,7 +773,9 @@ class Anchor(Token):
     """
     A generic anchor that defines a section that can be referred to.
     """
+    __slots__ = ('_document_section',)
     name = None
+    kind = TEXT  # never equal to a `Token`
 
     def __init__(self, string):
         super(Anchor, self).__init__(string)
@@ -250,21 +805,25 @@ class Anchor(Token):
         self._document_section = document_section
 
     def ref_as_href(self):
-        if self.reference.id_as_html():
-            return '#' + self.reference.id_as_html()
+        html_id = self.reference.id_as_html()
+        if html_id:
+            return '#' + html_id
         else:
             return None
 
 
 class Section(Anchor):
+    __slots__ = ()
     name = 'Secção'
 
 
 class SubSection(Anchor):
+    __slots__ = ()
     name = 'Sub-Secção'
 
 
 class Clause(Anchor):
+    __slots__ = ()
     name = 'Clausula'
 
     def as_str(self):
@@ -272,18 +831,22 @@ class Clause(Anchor):
 
 
 class Part(Anchor):
+    __slots__ = ()
     name = 'Parte'
 
 
 class Chapter(Anchor):
+    __slots__ = ()
     name = 'Capítulo'
 
 
 class Title(Anchor):
+    __slots__ = ()
     name = 'Título'
 
 
 class Annex(Anchor):
+    __slots__ = ()
     name = 'Anexo'
 
     def as_str(self):
@@ -294,6 +857,7 @@ class Annex(Anchor):
 
 
 class Article(Anchor):
+    __slots__ = ()
     name = 'Artigo'
 
     def as_html(self):
@@ -303,6 +867,7 @@ class Article(Anchor):
 
 
 class Number(Anchor):
+    __slots__ = ()
     name = 'Número'
 
     def as_str(self):
@@ -314,6 +879,7 @@ class Number(Anchor):
 
 
 class Line(Number):
+    __slots__ = ()
     name = 'Alínea'
 
     def as_str(self):
@@ -324,76 +890,476 @@ class Item(Number):
     """
     An item of an unordered list.
     """
+    __slots__ = ()
     name = 'Item'
 
     def as_str(self):
         return '%s' % self.number
 
 
+class _HTMLWriter(object):
+    """
+    Writes HTML into a list of `fragments` as `BaseElement._build_html` does:
+    HTML elements in which nothing is written are omitted, and so are new lines
+    inside them.
+    """
+    __slots__ = ('fragments', '_started', '_written')
+
+    def __init__(self):
+        self.fragments = []
+        self._started = []  # the (tag, attributes) started and not ended
+        self._written = 0  # how many of them were written
+
+    def start(self, tag_attrib):
+        self._started.append(tag_attrib)
+
+    def end(self):
+        tag = self._started.pop()[0]
+        if self._written > len(self._started):
+            self._written -= 1
+            self.fragments.append('</%s>' % tag)
+
+    def write(self, text):
+        started = self._started
+        if started:
+            text = text.replace('\n', '')  # \n have no meaning in HTML
+            if text and self._written != len(started):
+                for i in range(self._written, len(started)):
+                    start = BaseElement._html_start(*started[i])
+                    if i:
+                        start = start.replace('\n', '')
+                    self.fragments.append(start)
+                self._written = len(started)
+        if text:
+            self.fragments.append(text)
+
+
 class BaseDocumentSection(BaseElement):
+    """
+    A sequence of elements. Its hash, text and HTML are cached until it or any
+    element in it changes: they are only computed again for the sections on the
+    path to the change. Its context, from which the ids are built, is cached
+    until it is moved to another section.
+
+    When analysed from a text (see `analyser.analyse`), its text is a slice of
+    it, at its `span`, until it changes.
+    """
+    __slots__ = ('_children', '_lazy', '_parent_section', '_hash', '_str',
+                 '_html', '_source', '_cached_context', '_index',
+                 '_child_by_number')
 
     def __init__(self, *children):
         self._children = []
+        # its elements not yet built, in an iterable, instead of `_children`;
+        # see `from_json` and `Paragraph.compact`
+        self._lazy = None
+        self._parent_section = None
+        self._hash = None
+        self._str = None
+        self._html = None  # (context, html), see `_html_context`
+        self._source = None  # (text, start, end), see `span`
+        self._cached_context = None  # (context,), see `_context`
+        self._index = None  # of the document containing it, see `_Index`
+        self._child_by_number = None  # see `child_by_number`
         for child in children:
             self.append(child)
-        self._parent_section = None
+
+    def __getattr__(self, name):
+        # only called for the `_children` of a section whose elements are not
+        # built yet (see `_lazy`)
+        if name != '_children' or self._lazy is None:
+            raise AttributeError(name)
+        elements = self._lazy
+        self._lazy = None
+        self._children = []
+        for element in elements:
+            # nothing that depends on where it is was cached of it
+            if isinstance(element, (BaseDocumentSection, DocumentReference)):
+                element._parent_section = self
+            self._children.append(element)
+        return self._children
+
+    def _elements(self):
+        """
+        The list of its elements, without building them in `_children` if they
+        are stored otherwise (see `Paragraph.compact`).
+        """
+        return self._children
 
     def append(self, element):
         if isinstance(element, BaseDocumentSection):
+            element._set_parent(self)
+            self._forget_child_by_number()
+        elif isinstance(element, DocumentReference):
             element._parent_section = self
         self._children.append(element)
+        if self._index is not None:
+            self._index.add(element, self)
+        self._invalidate()
+
+    def _set_parent(self, section):
+        """
+        Moves this section into `section`, forgetting the contexts cached for
+        it and for the sections in it. Only sections with a cached context
+        can contain sections with one.
+        """
+        self._parent_section = section
+        stack = [self]
+        while stack:
+            section = stack.pop()
+            if section._cached_context is None:
+                continue
+            section._cached_context = None
+            if section._lazy is None:  # otherwise it has no sections yet
+                stack.extend(child for child in section._children
+                             if isinstance(child, BaseDocumentSection))
+            if isinstance(section, TitledDocumentSection) and \
+                    section._title is not None:
+                stack.append(section._title)
+
+    def _forget_child_by_number(self):
+        """
+        Forgets `child_by_number` of the sections that can contain the formal
+        sections of an element appended to this one.
+        """
+        section = self
+        while section is not None:
+            section._child_by_number = None
+            if section._is_formal() or isinstance(section, QuotationSection):
+                break
+            section = section._parent_section
+
+    def _is_formal(self):
+        """
+        Whether it is a section with an id (see `formal_sections`).
+        """
+        return False
+
+    def _invalidate(self, text=True):
+        """
+        Forgets what is cached of this section and of the sections containing
+        it, except their text without `text`. What is cached of a section is
+        also cached of all its elements.
+        """
+        section = self
+        while section is not None and (
+                section._hash is not None or section._html is not None or
+                text and (section._str is not None or
+                          section._source is not None)):
+            section._hash = None
+            section._html = None
+            if text:
+                section._str = None
+                section._source = None
+            section = section._parent_section
+
+    def _key(self):
+        return tuple(self._elements()),
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(other) is not type(self):
+            return False
+        if self._hash is not None and other._hash is not None and \
+                self._hash != other._hash:
+            return False
+        return self._key() == other._key()
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = super(BaseDocumentSection, self).__hash__()
+        return self._hash
 
     def __len__(self):
-        return len(self._children)
+        return len(self._elements())
 
     def as_str(self):
-        return ''.join(child.as_str() for child in self._children)
+        if self._source is not None:
+            text, start, end = self._source
+            return text[start:end]
+        if self._str is None:
+            self._str = self._as_str()
+        return self._str
+
+    def _as_str(self):
+        prefix, elements, suffix = self._str_parts()
+        return prefix + ''.join(element.as_str() for element in elements) + \
+            suffix
+
+    def _str_parts(self):
+        """
+        The parts of `as_str()`: the string before its elements, the elements
+        and the string after them.
+        """
+        return '', self._children, ''
 
-    def as_html(self):
-        string = ''
-        ol = False
-        ul = False
-        for child in self._children:
-            if ul and not isinstance(child, UnorderedDocumentSection):
-                string += '</ul>'
-                ul = False
-            if ol and not isinstance(child, OrderedDocumentSection):
-                string += '</ol>'
-                ol = False
+    @property
+    def span(self):
+        """
+        The (start, end) offsets of `as_str()` in the text it was analysed
+        from, or None if it was not or it changed since.
+        """
+        if self._source is not None:
+            return self._source[1:]
+        return None
+
+    def _set_source(self, text):
+        """
+        Makes `text` the source of the text of this section and of the sections
+        in it, if it is `as_str()`. Returns whether it is.
+        """
+        sources = []  # (section, start, end)
+        position = 0
+        # iterative, with the sections being read as (section, start, suffix)
+        stack = [self]
+        while stack:
+            element = stack.pop()
+            if element.__class__ is tuple:
+                section, start, suffix = element
+                if not text.startswith(suffix, position):
+                    return False
+                position += len(suffix)
+                sources.append((section, start, position))
+            elif isinstance(element, BaseDocumentSection):
+                prefix, elements, suffix = element._str_parts()
+                if not text.startswith(prefix, position):
+                    return False
+                stack.append((element, position, suffix))
+                position += len(prefix)
+                stack.extend(reversed(elements))
+            else:
+                string = element.as_str()
+                if not text.startswith(string, position):
+                    return False
+                position += len(string)
+        if position != len(text):
+            return False
+
+        for section, start, end in sources:
+            section._str = None
+            section._source = (text, start, end)
+        return True
+
+    def _html_parts(self, context):
+        """
+        The parts of the HTML of this section with `context`, in order: strings,
+        elements, and the start `(tag, attributes)` and end (`None`) of HTML
+        elements, that are omitted when nothing is written inside them (see
+        `_build_html`).
+        """
+        parts = []
+        self._html_children(parts)
+        return parts
 
-            if not ul and isinstance(child, UnorderedDocumentSection):
-                string += '<ul>'
-                ul = True
-            if not ol and isinstance(child, OrderedDocumentSection):
-                string += '<ol>'
-                ol = True
+    def _html_children(self, parts):
+        """
+        Appends the parts of the HTML of the children to `parts`, with
+        consecutive inline sections in HTML lists.
+        """
+        list_tag = None  # of the HTML list open
+        for child in self._children:
+            tag = None
+            if isinstance(child, InlineDocumentSection):
+                if isinstance(child, UnorderedDocumentSection):
+                    tag = 'ul'
+                elif isinstance(child, OrderedDocumentSection):
+                    tag = 'ol'
+            if tag != list_tag:
+                if list_tag is not None:
+                    parts.append('</%s>' % list_tag)
+                if tag is not None:
+                    parts.append('<%s>' % tag)
+                list_tag = tag
+
+            parts.append(child)
+
+        if list_tag is not None:
+            parts.append('</%s>' % list_tag)
+
+    def _html_context(self, context):
+        """
+        What the HTML of this section depends on besides its elements, given the
+        `context` of the section containing it: the id of the formal sections
+        containing it and itself (see `formal_id_tree`), '' when there are none,
+        or None when they have no ids.
+        """
+        return context
 
-            string += child.as_html()
+    def _context(self):
+        """
+        The context of this section, computed top-down from the closest section
+        containing it with a cached context, and cached.
+        """
+        sections = []
+        section = self
+        while section is not None and section._cached_context is None:
+            sections.append(section)
+            section = section._parent_section
+        context = '' if section is None else section._cached_context[0]
+        for section in reversed(sections):
+            context = section._html_context(context)
+            section._cached_context = (context,)
+        return context
+
+    def _cached_html(self, context):
+        if self._html is not None and self._html[0] == context:
+            return self._html[1]
+        return None
 
-        if ol:
-            string += '</ol>'
-        if ul:
-            string += '</ul>'
+    @staticmethod
+    def _write_html_parts(parts, context, writer):
+        """
+        Writes the `parts` of the HTML of a section with `context` into `writer`
+        until a section whose HTML is not cached, returned with its context.
+        Returns None when all parts were written.
+        """
+        for part in parts:
+            if isinstance(part, BaseDocumentSection):
+                part_context = part._html_context(context)
+                part._cached_context = (part_context,)
+                html = part._cached_html(part_context)
+                if html is None:
+                    return part, part_context
+                writer.write(html)
+            elif part is None:
+                writer.end()
+            elif part.__class__ is tuple:
+                writer.start(part)
+            elif part.__class__ is str:
+                writer.write(part)
+            else:
+                writer.write(part.as_html())
+        return None
+
+    def iter_html(self):
+        # iterative, so that each fragment is written once, independently of
+        # how deep it is in the document. Uses the cached HTML of sections but,
+        # to keep a small footprint, does not cache it.
+        writer = _HTMLWriter()
+        context = self._context()
+        html = self._cached_html(context)
+        if html is not None:
+            yield html
+            return
+
+        stack = [(iter(self._html_parts(context)), context)]
+        while stack:
+            parts, context = stack[-1]
+            section = self._write_html_parts(parts, context, writer)
+            if section is None:
+                stack.pop()
+            else:
+                stack.append((iter(section[0]._html_parts(section[1])),
+                              section[1]))
+            if len(writer.fragments) >= self._CHUNK:
+                yield ''.join(writer.fragments)
+                del writer.fragments[:]
+        if writer.fragments:
+            yield ''.join(writer.fragments)
 
-        return string
+    def as_html(self):
+        context = self._context()
+        html = self._cached_html(context)
+        if html is not None:
+            return html
+
+        # iterative, with a frame for each section rendered to cache its HTML
+        frames = [(self, context, iter(self._html_parts(context)),
+                   _HTMLWriter())]
+        while True:
+            section, context, parts, writer = frames[-1]
+            child = self._write_html_parts(parts, context, writer)
+            if child is not None:
+                frames.append((child[0], child[1],
+                               iter(child[0]._html_parts(child[1])),
+                               _HTMLWriter()))
+                continue
+
+            frames.pop()
+            html = ''.join(writer.fragments)
+            section._html = (context, html)
+            if not frames:
+                return html
+            frames[-1][3].write(html)
 
     def as_dict(self):
         return {self.__class__.__name__: [child.as_dict() for child in
-                                          self._children]}
+                                          self._elements()]}
+
+    @property
+    def child_by_number(self):
+        """
+        The formal sections in it that are not in other formal sections or in
+        quotations, by the class and the number of their anchors, e.g.
+        `{(Article, '1º'): <the article 1º>}`. On repeated numbers, the
+        first. Built when first used, and again after a section is appended.
+        """
+        if self._child_by_number is None:
+            result = {}
+            stack = list(reversed(self._elements()))
+            while stack:
+                element = stack.pop()
+                # paragraphs never have formal sections: their elements are
+                # not built for nothing (see `_lazy`)
+                if not isinstance(element, BaseDocumentSection) or \
+                        isinstance(element, (QuotationSection, Paragraph)):
+                    continue
+                if element._is_formal():
+                    key = (element.format, element.anchor.number)
+                    if key not in result:
+                        result[key] = element
+                else:
+                    stack.extend(reversed(element._elements()))
+            self._child_by_number = result
+        return self._child_by_number
+
+    def compact(self):
+        """
+        Stores the paragraphs in it compactly (see `Paragraph.compact`).
+        """
+        stack = [self]
+        while stack:
+            section = stack.pop()
+            if isinstance(section, Paragraph):
+                section.compact()
+                if section._lazy is not None:
+                    continue
+            stack.extend(element for element in section._children
+                         if isinstance(element, BaseDocumentSection))
+            if isinstance(section, TitledDocumentSection) and \
+                    section._title is not None:
+                stack.append(section._title)
+
+    def iter_all(self, condition=None):
+        """
+        Yields the elements in it and in its sections, in order, that satisfy
+        `condition`, if given.
+        """
+        stack = [iter(self._elements())]
+        while stack:
+            for child in stack[-1]:
+                if condition is None or condition(child):
+                    yield child
+                if isinstance(child, BaseDocumentSection):
+                    stack.append(iter(child._elements()))
+                    break
+            else:
+                stack.pop()
 
     def find_all(self, condition, recursive=False):
         if recursive:
-            def _find_all(root):
-                result = []
-                if isinstance(root, BaseDocumentSection):
-                    for child in root._children:
-                        if condition(child):
-                            result.append(child)
-                        result += _find_all(child)
-                return result
-            return _find_all(self)
-
-        return [child for child in self._children if condition(child)]
+            return list(self.iter_all(condition))
+
+        return [child for child in self._elements() if condition(child)]
+
+    def find_all_instances(self, klass):
+        """
+        Returns the elements in it and in its sections that are instances of
+        `klass`, in order.
+        """
+        return [element for element in self.iter_all()
+                if isinstance(element, klass)]
 
     def id_tree(self):
         tree = []
@@ -406,7 +1372,7 @@ class BaseDocumentSection(BaseElement):
         """
         Yields tuples (name, number) of all its `DocumentReference`s.
         """
-        refs = self.find_all(lambda x: isinstance(x, DocumentReference), True)
+        refs = self.find_all_instances(DocumentReference)
         ref_set = set()
         for ref in refs:
             ref_set.add((ref.name, ref.number))
@@ -417,28 +1383,268 @@ class BaseDocumentSection(BaseElement):
         Uses a dictionary of the form `(name, ref)-> url` to set the href
         of its own `DocumentReference`s.
         """
-        refs = self.find_all(lambda x: isinstance(x, DocumentReference), True)
+        refs = self.find_all_instances(DocumentReference)
         for ref in refs:
             if (ref.name, ref.number) in mapping:
                 ref.set_href(mapping[(ref.name, ref.number)])
 
 
+class _CompactElements(object):
+    """
+    The elements of a compact `Paragraph`: their text, the offset in it where
+    each ends, and the elements that are not plain `Token`s with their
+    indexes. Iterating it builds the elements.
+    """
+    __slots__ = ('text', '_ends', '_others')
+
+    def __init__(self, elements):
+        strings = []
+        self._ends = array('I')
+        others = []
+        end = 0
+        for index, element in enumerate(elements):
+            string = element.as_str()
+            strings.append(string)
+            end += len(string)
+            self._ends.append(end)
+            if element.__class__ is not Token:
+                others.append((index, element))
+        self.text = ''.join(strings)
+        self._others = tuple(others)
+
+    def __len__(self):
+        return len(self._ends)
+
+    def __iter__(self):
+        text = self.text
+        others = iter(self._others)
+        other = next(others, None)
+        start = 0
+        for index, end in enumerate(self._ends):
+            if other is not None and other[0] == index:
+                yield other[1]
+                other = next(others, None)
+            else:
+                yield Token(text[start:end])
+            start = end
+
+    def html_parts(self, parts):
+        """
+        Appends to `parts` the text, in a string between each of the other
+        elements, and the other elements.
+        """
+        text = self.text
+        ends = self._ends
+        start = 0  # of the text not in `parts` yet
+        for index, element in self._others:
+            element_start = ends[index - 1] if index else 0
+            if element_start > start:
+                parts.append(text[start:element_start])
+            parts.append(element)
+            start = ends[index]
+        if start < len(text):
+            parts.append(text[start:])
+
+
 class Paragraph(BaseDocumentSection):
+    """
+    A sequence of tokens. It can also be stored compactly (see `compact`).
+    """
+    __slots__ = ()
 
-    def as_html(self):
-        return self._build_html('p', super(Paragraph, self).as_html(), {})
+    _tag = 'p'
+
+    def compact(self):
+        """
+        Stores its elements as their text, the offsets where each ends and the
+        elements that are not plain `Token`s. Plain tokens are then built when
+        used, but not kept, until it is changed. Does nothing if there are
+        sections in it.
+        """
+        if self._lazy.__class__ is _CompactElements:
+            return
+        elements = self._children
+        if any(isinstance(element, BaseDocumentSection)
+               for element in elements):
+            return
+        self._lazy = _CompactElements(elements)
+        del self._children
+
+    def __getstate__(self):
+        # copied and pickled as stored: a compact one stays compact
+        state = {}
+        for klass in self.__class__.__mro__:
+            for name in getattr(klass, '__slots__', ()):
+                if name == '_children' and \
+                        self._lazy.__class__ is _CompactElements:
+                    continue
+                try:
+                    state[name] = getattr(self, name)
+                except AttributeError:  # not set
+                    pass
+        return None, state
+
+    def _elements(self):
+        if self._lazy.__class__ is _CompactElements:
+            return list(self._lazy)
+        return self._children
+
+    def __len__(self):
+        if self._lazy.__class__ is _CompactElements:
+            return len(self._lazy)
+        return super(Paragraph, self).__len__()
+
+    def _str_parts(self):
+        if self._lazy.__class__ is _CompactElements:
+            return self._lazy.text, (), ''
+        return super(Paragraph, self)._str_parts()
+
+    def _html_parts(self, context):
+        parts = [(self._tag, {})]
+        if self._lazy.__class__ is _CompactElements:
+            self._lazy.html_parts(parts)
+        else:
+            self._html_children(parts)
+        parts.append(None)
+        return parts
 
 
 class InlineParagraph(Paragraph):
-    def as_html(self):
-        return self._build_html('span', super(Paragraph, self).as_html(), {})
+    __slots__ = ()
+
+    _tag = 'span'
+
+
+class _Index(object):
+    """
+    The elements of a document by class, kept up to date as elements are
+    appended to any of its sections. Plain `Token`s, most of the elements, are
+    left out: they are shared and cannot be changed.
+
+    Elements are numbered in the order they are added, which is their order in
+    the document while they are only appended at its end; once one is appended
+    elsewhere, the index is built again on the next `find`.
+    """
+    __slots__ = ('_document', '_elements', '_positions', '_in_order')
+
+    def __init__(self, document):
+        self._document = document
+        document._index = self
+        self._build()
+
+    def _build(self):
+        self._elements = {}  # class: [element]
+        self._positions = {}  # id(element): position
+        self._in_order = True
+        for element in self._document._elements():
+            self.add(element)
+
+    def add(self, element, section=None):
+        """
+        Adds `element`, appended to `section`, and, if it is a section, the
+        elements in it.
+        """
+        if section is not None and self._in_order and \
+                not self._at_end(section):
+            self._in_order = False
+        stack = [element]
+        while stack:
+            element = stack.pop()
+            klass = element.__class__
+            if klass is Token:
+                continue
+            if klass not in self._elements:
+                self._elements[klass] = []
+            self._elements[klass].append(element)
+            self._positions[id(element)] = len(self._positions)
+            if isinstance(element, BaseDocumentSection):
+                element._index = self
+                stack.extend(reversed(element._elements()))
+
+    def __getstate__(self):
+        # positions are by the ids of the elements: built again when copied
+        return None, {'_document': self._document, '_elements': {},
+                      '_positions': {}, '_in_order': False}
+
+    @staticmethod
+    def _at_end(section):
+        """
+        Whether what is appended to `section` is at the end of the document.
+        """
+        parent = section._parent_section
+        while parent is not None:
+            elements = parent._elements()
+            if not elements or elements[-1] is not section:
+                return False
+            section, parent = parent, parent._parent_section
+        return True
+
+    def find(self, klass):
+        """
+        Returns the elements that are instances of `klass`, in order, or None
+        if `klass` includes `Token`.
+        """
+        if issubclass(Token, klass):
+            return None
+        if not self._in_order:
+            self._build()
+        lists = [elements for element_class, elements in self._elements.items()
+                 if issubclass(element_class, klass)]
+        result = [element for elements in lists for element in elements]
+        if len(lists) > 1:
+            positions = self._positions
+            result.sort(key=lambda element: positions[id(element)])
+        return result
 
 
 class Document(BaseDocumentSection):
-    pass
+    __slots__ = ()
+
+    @property
+    def text(self):
+        """
+        The text it was analysed from, or None if it was not or it changed
+        since (see `span`).
+        """
+        if self._source is not None:
+            return self._source[0]
+        return None
+
+    def find_all_instances(self, klass):
+        """
+        Like in `BaseDocumentSection` but, except for the first call and for
+        classes of plain tokens, without going through the document.
+        """
+        if self._index is None:
+            _Index(self)
+        result = self._index.find(klass)
+        if result is None:
+            return super(Document, self).find_all_instances(klass)
+        return result
+
+    def get_section(self, path):
+        """
+        Returns the `DocumentSection` at `path`, either its `id_as_html()` or
+        the classes and numbers of the anchors of the formal sections up to
+        it, e.g. `((Article, '12º'), (Number, '2'), (Line, 'a)'))`; or None
+        if there is none. Only the sections on the path are searched (see
+        `child_by_number`).
+        """
+        if isinstance(path, str):
+            path = DocumentSection._id_path(path)
+            if path is None:
+                return None
+        section = self
+        for anchor_class, number in path:
+            section = section.child_by_number.get((anchor_class, number))
+            if section is None:
+                return None
+        return None if section is self else section
 
 
 class DocumentSection(BaseDocumentSection):
+    __slots__ = ('_anchor',)
+
     formal_sections = [Annex, Article, Number, Line, Item]
 
     html_classes = {
@@ -456,8 +1662,8 @@ class DocumentSection(BaseDocumentSection):
     }
 
     def __init__(self, anchor, *children):
-        super(DocumentSection, self).__init__(*children)
         self._anchor = anchor
+        super(DocumentSection, self).__init__(*children)
         self._anchor.reference = self
 
     def as_dict(self):
@@ -465,6 +1671,9 @@ class DocumentSection(BaseDocumentSection):
         json[self.__class__.__name__].insert(0, self.anchor.as_dict())
         return json
 
+    def _key(self):
+        return (self._anchor,) + super(DocumentSection, self)._key()
+
     @property
     def anchor(self):
         return self._anchor
@@ -473,6 +1682,17 @@ class DocumentSection(BaseDocumentSection):
     def format(self):
         return self.anchor.format
 
+    def _is_formal(self):
+        return self.format in self.formal_sections
+
+    def _html_context(self, context):
+        if context is not None and self.format in self.formal_sections:
+            if context:
+                return '%s-%s-%s' % (context, self._anchor.name,
+                                     self._anchor.number)
+            return '%s-%s' % (self._anchor.name, self._anchor.number)
+        return context
+
     def formal_id_tree(self):
         filtered_tree = []
         for e in self.id_tree():
@@ -483,20 +1703,42 @@ class DocumentSection(BaseDocumentSection):
 
         return filtered_tree
 
-    def id_as_html(self):
-        string = '-'.join(e.anchor.name + '-' + e.anchor.number for e in
-                          self.formal_id_tree())
-        if string != '':
-            return string
-        else:
+    @staticmethod
+    def _html_id(context):
+        # the `id_as_html` of the section with `context`, without going up
+        return context or None
+
+    @classmethod
+    def _id_path(cls, html_id):
+        # the path of `Document.get_section` from an `id_as_html`, or None
+        anchors = dict((anchor.name, anchor) for anchor in cls.formal_sections)
+        path = []
+        for part in html_id.split('-'):
+            if path and path[-1][1] is None:
+                path[-1][1] = part
+            elif part in anchors:
+                path.append([anchors[part], None])
+            elif path:
+                path[-1][1] += '-' + part  # numbers such as '1-A'
+            else:
+                return None
+        if not path or path[-1][1] is None:
             return None
+        return path
+
+    def id_as_html(self):
+        return self._html_id(self._context())
 
 
 class TitledDocumentSection(DocumentSection):
+    __slots__ = ('_title',)
 
     def __init__(self, anchor, title=None, *children):
+        self._title = None
         super(TitledDocumentSection, self).__init__(anchor, *children)
         self._title = title
+        if isinstance(title, BaseDocumentSection):
+            title._set_parent(self)
 
     def as_dict(self):
         json = super(TitledDocumentSection, self).as_dict()
@@ -504,6 +1746,11 @@ class TitledDocumentSection(DocumentSection):
             json[self.__class__.__name__].insert(1, self._title.as_dict())
         return json
 
+    def _key(self):
+        # in the order of `as_dict`, where a missing title is omitted
+        title = () if self._title is None else (self._title,)
+        return (self._anchor,) + title + tuple(self._children)
+
     hierarchy_html_titles = {
         Part: 'h2',
         Annex: 'h2',
@@ -515,23 +1762,22 @@ class TitledDocumentSection(DocumentSection):
         Clause: 'h5',
     }
 
-    def as_html(self):
-        inner = self.anchor.as_html()
+    def _html_parts(self, context):
+        parts = [('div', {'class': self.html_classes[self.format],
+                          'id': self._html_id(context)}),
+                 (self.hierarchy_html_titles[self.format], {'class': 'title'}),
+                 self.anchor]
         if self._title is not None:
-            inner += self._title.as_html()
-        container = self._build_html(self.hierarchy_html_titles[self.format],
-                                     inner, {'class': 'title'})
-        rest = super(TitledDocumentSection, self).as_html()
-
-        return self._build_html('div', container + rest,
-                                {'class': self.html_classes[self.format],
-                                 'id': self.id_as_html()})
+            parts.append(self._title)
+        parts.append(None)
+        self._html_children(parts)
+        parts.append(None)
+        return parts
 
-    def as_str(self):
-        string = self.anchor.as_str()
+    def _str_parts(self):
         if self._title is not None:
-            string += self._title.as_str()
-        return string + super(TitledDocumentSection, self).as_str()
+            return self.anchor.as_str(), [self._title] + self._children, ''
+        return self.anchor.as_str(), self._children, ''
 
     @property
     def title(self):
@@ -540,30 +1786,37 @@ class TitledDocumentSection(DocumentSection):
     @title.setter
     def title(self, title):
         assert(isinstance(title, Paragraph))
+        title._set_parent(self)
         self._title = title
+        self._invalidate()
 
 
 class InlineDocumentSection(DocumentSection):
     """
     A section whose elements are inline.
     """
+    __slots__ = ()
+
     formats = {}
 
-    def as_html(self):
-        container = self._build_html('span', self.anchor.as_html(), {})
-        rest = super(InlineDocumentSection, self).as_html()
-        return self._build_html('li', container + rest,
-                                {'class': self.html_classes[self.format],
-                                 'id': self.id_as_html()})
+    def _html_parts(self, context):
+        parts = [('li', {'class': self.html_classes[self.format],
+                         'id': self._html_id(context)}),
+                 ('span', {}), self.anchor, None]
+        self._html_children(parts)
+        parts.append(None)
+        return parts
 
-    def as_str(self):
-        return self.anchor.as_str() + super(InlineDocumentSection, self).as_str()
+    def _str_parts(self):
+        return self.anchor.as_str(), self._children, ''
 
 
 class OrderedDocumentSection(InlineDocumentSection):
     """
     A section whose elements are inline and ordered.
     """
+    __slots__ = ()
+
     formats = {Number, Line}
 
 
@@ -571,6 +1824,8 @@ class UnorderedDocumentSection(InlineDocumentSection):
     """
     A section whose elements are inline and un-ordered.
     """
+    __slots__ = ()
+
     formats = {Item}
 
 
@@ -578,9 +1833,16 @@ class QuotationSection(BaseDocumentSection):
     """
     A Section quoting something.
     """
-    def as_html(self):
-        return '<blockquote>%s</blockquote>' % \
-               super(QuotationSection, self).as_html()
+    __slots__ = ()
 
-    def as_str(self):
-        return '«%s»' % super(QuotationSection, self).as_str()
+    def _html_context(self, context):
+        return None  # sections inside quotations have no ids
+
+    def _html_parts(self, context):
+        parts = ['<blockquote>']
+        self._html_children(parts)
+        parts.append('</blockquote>')
+        return parts
+
+    def _str_parts(self):
+        return '«', self._children, '»'
@@ -1,3 +1,5 @@
+import re
+
 from pt_law_parser.expressions import Document, TitledDocumentSection
 
 
@@ -10,14 +12,20 @@ class BaseElement(object):
         assert(isinstance(element, (str, Element)))
         self._children.append(element)
 
-    def as_html(self):
-        string = ''
+    def iter_html(self):
         for child in self._children:
             if isinstance(child, str):
-                string += child
+                yield child
             else:
-                string += child.as_html()
-        return string
+                yield from child.iter_html()
+
+    def write_html(self, sink):
+        write = sink.append if isinstance(sink, list) else sink.write
+        for fragment in self.iter_html():
+            write(fragment)
+
+    def as_html(self):
+        return ''.join(self.iter_html())
 
 
 class Element(BaseElement):
@@ -32,14 +40,15 @@ class Element(BaseElement):
         else:
             self._attrib = attrib
 
-    def as_html(self):
+    def iter_html(self):
         attributes = ' '.join('%s="%s"' % (key, value)
                               for (key, value) in sorted(self._attrib.items()))
         if attributes:
             attributes = ' ' + attributes
 
-        return '<{0}{1}>{2}</{0}>'.format(self.tag, attributes,
-                                          super(Element, self).as_html())
+        yield '<{0}{1}>'.format(self.tag, attributes)
+        yield from super(Element, self).iter_html()
+        yield '</{0}>'.format(self.tag)
 
 
 def html_toc(document):
@@ -60,8 +69,9 @@ def html_toc(document):
             if child.title is not None:
                 name += ' ' + child.title.as_str()
 
-            if child.anchor.ref_as_href():
-                tag = Element('a', {'href': child.anchor.ref_as_href()})
+            href = child.anchor.ref_as_href()
+            if href:
+                tag = Element('a', {'href': href})
             else:
                 tag = Element('h5', {'class': 'tree-toggler'})
             tag.append(name)
@@ -77,10 +87,51 @@ def html_toc(document):
     return index
 
 
+_HTML_START = '<html xmlns="http://www.w3.org/1999/xhtml">' \
+              '<head><meta http-equiv="Content-Type" content="text/html; ' \
+              'charset=utf-8"></head>'
+
+_LINE_START = re.compile('<(?=div|p|span)')
+
+
 def valid_html(html):
-        html = '<html xmlns="http://www.w3.org/1999/xhtml">'\
-               '<head><meta http-equiv="Content-Type" content="text/html; ' \
-               'charset=utf-8"></head>' + html + '</html>'
+        html = _HTML_START + html + '</html>'
         html = html.replace('\n', '').replace('<div', '\n<div')\
             .replace('<p', '\n<p').replace('<span', '\n<span')
         return html
+
+
+def iter_valid_html(element, chunk_size=2**16):
+    """
+    Yields `valid_html(element.as_html())` in chunks of about `chunk_size`
+    characters, e.g. for a chunked HTTP response, without building it.
+    """
+    chunk = [_HTML_START]
+    size = 0
+    rest = ''  # the end of the last chunk, that may be the start of a tag
+    for fragment in element.iter_html():
+        chunk.append(fragment)
+        size += len(fragment)
+        if size >= chunk_size:
+            html = rest + ''.join(chunk).replace('\n', '')
+            # a '<' near the end may start a tag that ends in the next chunk
+            end = html.rfind('<', len(html) - 4)
+            if end == -1:
+                end = len(html)
+            rest = html[end:]
+            if end:
+                yield _LINE_START.sub('\n<', html[:end])
+            chunk = []
+            size = 0
+    chunk.append('</html>')
+    yield _LINE_START.sub('\n<', rest + ''.join(chunk).replace('\n', ''))
+
+
+def write_valid_html(element, sink, chunk_size=2**16):
+    """
+    Writes `valid_html(element.as_html())` into `sink`, a list or a file-like
+    object.
+    """
+    write = sink.append if isinstance(sink, list) else sink.write
+    for chunk in iter_valid_html(element, chunk_size):
+        write(chunk)
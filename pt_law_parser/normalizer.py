@@ -1,11 +1,30 @@
 import re
 
 
+# names of sections that documents also write in uppercase, e.g. 'ARTIGO'.
+UPPERCASE_NAMES = ('Artigo', 'Parte', 'Título', 'Capítulo', 'Secção', 'Anexo')
+
+
+def uppercase_spellings():
+    """
+    Returns the uppercase spellings of each of `UPPERCASE_NAMES`, for the parser
+    to tokenize them as the name (see `normalize`).
+    """
+    return dict((name, [name.upper()]) for name in UPPERCASE_NAMES)
+
+
 def replace_eu_links(text):
     return re.sub('<a.*?>(.*?)</a>', lambda m: m.group(1), text)
 
 
-def normalize(text):
+def normalize(text, fold_case=True):
+    """
+    Normalizes the html `text` of a publication to the text the parser expects.
+
+    Without `fold_case`, the `UPPERCASE_NAMES` are kept in uppercase and the
+    parser must be given their `uppercase_spellings` to tokenize them as the
+    names, which saves a full copy of the text per name.
+    """
 
     text = ' '.join(text.split())
 
@@ -24,12 +43,12 @@ def normalize(text):
     text = text.replace('<p> ', '<p>')
     text = text.replace(' </p>', '</p>')
 
-    text = text.replace('ARTIGO', 'Artigo')
-    text = text.replace('PARTE', 'Parte')
-    text = text.replace('TÍTULO', 'Título')
-    text = text.replace('CAPÍTULO', 'Capítulo')
-    text = text.replace('SECÇÃO', 'Secção')
-    text = text.replace('ANEXO', 'Anexo')
+    if fold_case:
+        for name in UPPERCASE_NAMES:
+            text = text.replace(name.upper(), name)
+        article = 'Artigo'
+    else:
+        article = '(?:Artigo|ARTIGO)'
 
     # older documents use "Art." instead of "Artigo"; change it
     text = re.sub('Art\. (\d+)\.º (.*?)',
@@ -37,12 +56,12 @@ def normalize(text):
                   text)
 
     # older documents use "Artigo #.º - 1" instead of "Artigo #.º 1"; change it
-    text = re.sub('Artigo (\d+)\.º - (.*?)',
+    text = re.sub(article + ' (\d+)\.º - (.*?)',
                   lambda m: "Artigo %s.º %s" % m.group(1, 2),
                   text)
 
     # create <p>'s specifically for start of articles
-    text = re.sub("<p>Artigo (\d+)\.º (.*?)</p>",
+    text = re.sub("<p>" + article + " (\d+)\.º (.*?)</p>",
                   lambda m: "<p>Artigo %s.º</p><p>%s</p>" % m.group(1, 2),
                   text)
 
@@ -8,7 +8,7 @@ import re
 from pt_law_parser.expressions import Token, DocumentReference, ArticleReference, \
     NumberReference, LineReference, EULawReference, Clause, \
     Article, Number, Line, Annex, Title, Chapter, Part, Section, SubSection, Anchor, \
-    Reference, Item
+    Reference, Item, DOT, NEWLINE
 
 
 BASE_ARTICLE_NUMBER_REGEX = '[\dA-Z\-]+º(?:\-[A-Z]+)?'
@@ -40,7 +40,15 @@ class Observer(object):
       of tokens using `replace_in` or not.
 
     Use `finish` to finalise its activity (i.e. sets `is_done=True`)
+
+    Tokens are shared and must not be changed: `replace_in` replaces them in the
+    list by new elements.
+
+    The class attribute `requires` are strings without which, as tokens, the
+    observer never needs replace; the parser skips it in texts without them.
     """
+    requires = ()
+
     def __init__(self, index, token):
         self._string = token.as_str()
         self._is_done = False
@@ -112,7 +120,7 @@ class DocumentRefObserver(RefObserver):
             self._numbers[index] = token
             return True
 
-        if token in (Token('.'), Token('\n')):
+        if token.kind in (DOT, NEWLINE):
             self.finish()
 
         return False
@@ -126,7 +134,7 @@ class ArticleRefObserver(RefObserver):
         self._parent = None
 
     def observe(self, index, token, caught):
-        if token in (Token('.'), Token('\n')):
+        if token.kind in (DOT, NEWLINE):
             self.finish()
             return False
 
@@ -146,7 +154,7 @@ class NumberRefObserver(ArticleRefObserver):
     klass = NumberReference
 
     def observe(self, index, token, caught):
-        if token in (Token('.'), Token('\n')):
+        if token.kind in (DOT, NEWLINE):
             self.finish()
             return False
 
@@ -168,7 +176,7 @@ class LineRefObserver(ArticleRefObserver):
     klass = LineReference
 
     def observe(self, index, token, caught):
-        if token in (Token('.'), Token('\n')):
+        if token.kind in (DOT, NEWLINE):
             self.finish()
             return False
 
@@ -246,6 +254,7 @@ class EULawRefObserver(GenericRuleObserver):
                               'Regulamento CEE'),
               lambda x: x == ' ', lambda x: x == 'nº', lambda x: x == ' ',
               lambda x: re.match(EULAW_NUMBER_REGEX, x)]
+    requires = ('nº',)
 
     def __init__(self, index, token):
         super(EULawRefObserver, self).__init__(index, token)
@@ -298,6 +307,7 @@ def common_rules(name, regex):
 class ArticleObserver(AnchorObserver):
     anchor_klass = Article
     _rules = common_rules(Article.name, BASE_ARTICLE_NUMBER_REGEX + '|único')
+    requires = (Article.name,)
     number_at = 3
     take_up_to = 4
 
@@ -305,12 +315,14 @@ class ArticleObserver(AnchorObserver):
 class SubSectionObserver(ArticleObserver):
     anchor_klass = SubSection
     _rules = common_rules(SubSection.name, '[IVX]*')
+    requires = (SubSection.name,)
 
 
 class ClauseObserver(ArticleObserver):
     anchor_klass = Clause
     _rules = [lambda x: x == '\n', lambda x: re.match('^[IVX]*$', x),
               lambda x: x == '\n']
+    requires = ()
     number_at = 1
     take_up_to = 2
 
@@ -318,25 +330,30 @@ class ClauseObserver(ArticleObserver):
 class SectionObserver(ArticleObserver):
     anchor_klass = Section
     _rules = common_rules(Section.name, '[IVX]*')
+    requires = (Section.name,)
 
 
 class PartObserver(ArticleObserver):
     anchor_klass = Part
     _rules = common_rules(anchor_klass.name, '[IVX]*')
+    requires = (anchor_klass.name,)
 
 
 class ChapterObserver(ArticleObserver):
     anchor_klass = Chapter
     _rules = common_rules(Chapter.name, '[IVX]*')
+    requires = (Chapter.name,)
 
 
 class AnnexObserver(ArticleObserver):
     anchor_klass = Annex
     _rules = common_rules(Annex.name, '[IVX]*')
+    requires = (Annex.name,)
 
 
 class UnnumberedAnnexObserver(GenericRuleObserver):
     _rules = [lambda x: x == '\n', lambda x: x == Annex.name, lambda x: x == '\n']
+    requires = (Annex.name,)
 
     def replace_in(self, result):
         result[self._index + 2] = Token('')
@@ -346,6 +363,7 @@ class UnnumberedAnnexObserver(GenericRuleObserver):
 class TitleObserver(ArticleObserver):
     anchor_klass = Title
     _rules = common_rules(Title.name, '[IVX]*')
+    requires = (Title.name,)
 
 
 class NumberObserver(AnchorObserver):
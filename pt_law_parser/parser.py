@@ -4,7 +4,28 @@ Contains the `parse` function and auxiliary classes. With the help of observers,
 """
 
 from pt_law_parser import observers
-from pt_law_parser.tokenizer import tokenize
+from pt_law_parser.expressions import register_kind
+from pt_law_parser.tokenizer import tokenize_stream, tokenize_stream_many, \
+    Tokenizer
+
+
+# compiled tokenizers, by their frozenset of keyterms. See `get_tokenizer`.
+_tokenizers = {}
+
+
+def get_tokenizer(terms, spellings=None):
+    """
+    Returns a `Tokenizer` of `terms` with their registered kinds, compiled once
+    per set of terms and `spellings` (see `Tokenizer`). Once pickled, its kinds
+    are those registered where it is unpickled.
+    """
+    spellings = spellings or {}
+    key = (frozenset(terms), frozenset((term, tuple(term_spellings))
+                                       for term, term_spellings in spellings.items()))
+    if key not in _tokenizers:
+        keyterms = sorted(key[0])
+        _tokenizers[key] = Tokenizer(keyterms, register_kind, spellings)
+    return _tokenizers[key]
 
 
 class ObserverManager(object):
@@ -12,6 +33,10 @@ class ObserverManager(object):
         self._rules = rules
         self._observers = {}
 
+        # the rules by the kind of their term, see `generate`.
+        self._kind_rules = dict((register_kind(term), klass)
+                                for term, klass in rules.items())
+
         # A cache, see _refresh_items. This optimization was pre-profiled.
         # It save us ~30% on analysing doc_id=640339.
         self._items = {}
@@ -19,9 +44,16 @@ class ObserverManager(object):
     def _refresh_items(self):
         self._items = sorted(dict(self._observers).items(), reverse=True)
 
-    def generate(self, index, token):
-        if token.as_str() in self._rules:
-            observer = self._rules[token.as_str()](index, token)
+    def generate(self, index, token, kind=None):
+        """
+        Starts an observer at `index` if `token` is one of the terms. `kind` is
+        the kind of `token`, when already known.
+        """
+        if kind is None:
+            kind = token.kind
+        klass = self._kind_rules.get(kind)
+        if klass is not None:
+            observer = klass(index, token)
             self._observers[index] = observer
             self._refresh_items()
 
@@ -29,6 +61,14 @@ class ObserverManager(object):
     def terms(self):
         return set(self._rules.keys())
 
+    def can_replace(self, kinds, strings):
+        """
+        Returns whether any of its observers can replace tokens in a text with
+        tokens of `kinds` and `strings` (sets). See `Observer.requires`.
+        """
+        return any(kind in kinds and strings.issuperset(klass.requires)
+                   for kind, klass in self._kind_rules.items())
+
     def observe(self, index, token, caught):
         for i, observer in self._items:
             caught = observer.observe(index, token, caught) or caught
@@ -54,22 +94,37 @@ class ObserverManager(object):
         self._refresh_items()
 
 
-def parse(string, managers, terms=set()):
+def _terms(managers, terms):
     """
-    Parses a string into a list of expressions. Uses managers to replace `Token`s
-    by other elements.
+    Returns the set of `terms` and the terms of all `managers`.
     """
-    result = []  # the end result
-
+    terms = set(terms)
     for manager in managers:
         terms |= manager.terms
+    return terms
+
+
+def _active_managers(managers, stream):
+    """
+    Returns the `managers` that can replace tokens of `stream`. The others never
+    change the result.
+    """
+    kinds = set(stream.kinds)
+    strings = set(stream.strings)
+    return [manager for manager in managers
+            if manager.can_replace(kinds, strings)]
+
+
+def _parse_tokens(stream, managers):
+    result = []  # the end result
+    managers = _active_managers(managers, stream)
 
-    for index, token in enumerate(tokenize(string, terms)):
+    for index, (token, kind) in enumerate(zip(stream, stream.kinds)):
         result.append(token)
 
         caught = False
         for manager in managers:
-            manager.generate(index, token)
+            manager.generate(index, token, kind)
             caught = manager.observe(index, token, caught) or caught
             manager.replace_in(result)
 
@@ -79,6 +134,33 @@ def parse(string, managers, terms=set()):
     return result
 
 
+def parse(string, managers, terms=set(), spellings=None, tokenizer=None):
+    """
+    Parses a string into a list of expressions. Uses managers to replace `Token`s
+    by other elements. `spellings` maps terms to other spellings of them that are
+    tokenized as the term (e.g. `normalizer.uppercase_spellings()`); they do not
+    make the terms keyterms.
+
+    `tokenizer`, a `Tokenizer` from `get_tokenizer` (e.g. one sent to a worker
+    process), is used instead of `terms` and `spellings`; it must have the terms
+    of the managers.
+    """
+    if tokenizer is None:
+        tokenizer = get_tokenizer(_terms(managers, terms), spellings)
+    return _parse_tokens(tokenize_stream(string, tokenizer), managers)
+
+
+def parse_many(strings, managers, terms=set(), spellings=None, tokenizer=None):
+    """
+    Parses each string of `strings` like `parse`, tokenizing all of them in a
+    single batch. Returns a list with the list of expressions of each string.
+    """
+    if tokenizer is None:
+        tokenizer = get_tokenizer(_terms(managers, terms), spellings)
+    return [_parse_tokens(stream, managers)
+            for stream in tokenize_stream_many(strings, tokenizer)]
+
+
 common_managers = [
     ObserverManager({'Diretiva': observers.EULawRefObserver,
                      'Decisão de Execução': observers.EULawRefObserver,
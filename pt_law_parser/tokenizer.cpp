@@ -1,4 +1,6 @@
+#define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <climits>
 #include <vector>
 
 #include "tokenizer.h"
@@ -6,47 +8,808 @@
 using namespace std;
 
 
-static PyObject *_tokenize(PyObject *self, PyObject *args) {
-        PyObject * container;
-        char * the_string;
-        int string_size;
-        if (! PyArg_ParseTuple(args, "s#O", &the_string, &string_size, &container)) return NULL;
-
-        string text(the_string);
-
-        long int num_items = PySequence_Size(container);
-
-        if (num_items < 0) return NULL; // Not a list
-
+/*
+ * Converts a Python sequence of strings to a vector of (utf-8) strings.
+ * Returns false with an exception set on failure.
+ */
+static bool _strings_vector(PyObject * container, vector<string> & strings) {
         container = PySequence_Fast(container, "expected a sequence");
-        // build the vector of strings
-        vector<string> keyterms(num_items);
-        for (unsigned int i = 0; i < num_items; i++) {
+        if (container == NULL) return false;
+
+        Py_ssize_t num_items = PySequence_Fast_GET_SIZE(container);
+        strings.resize(num_items);
+        for (Py_ssize_t i = 0; i < num_items; i++) {
                 // grab the string object from the next element of the list
                 PyObject * strObj = PySequence_Fast_GET_ITEM(container, i);
-                char * string;
-                int size;
+                const char * string;
+                Py_ssize_t size;
 
                 // make it a string
-                PyArg_Parse(strObj, "s#", &string, &size);
-                keyterms[i] = string;
+                if (! PyArg_Parse(strObj, "s#", &string, &size)) {
+                        Py_DECREF(container);
+                        return false;
+                }
+                strings[i] = std::string(string, size);
         }
         Py_DECREF(container);  // confirmed leakage without this call.
-        vector<string> tokens = tokenize(the_string, keyterms);
+        return true;
+}
 
-        // build the Python list back
-        PyObject *PList = PyList_New(tokens.size());
-        for (unsigned int i = 0; i < tokens.size(); i++) {
-                PyList_SetItem(PList, i, Py_BuildValue("s#", tokens[i].c_str(), tokens[i].size()));
+
+static void _release_buffers(vector<Py_buffer> & buffers) {
+        for (size_t i = 0; i < buffers.size(); i++)
+                PyBuffer_Release(&buffers[i]);
+        buffers.clear();
+}
+
+
+/*
+ * Gets the (utf-8) text of each element of a Python sequence of either strings
+ * or objects with the buffer protocol (e.g. `bytes`, `memoryview`, `mmap`),
+ * without copying them. Returns false with an exception set on failure;
+ * otherwise they must be released with `_release_buffers`.
+ */
+static bool _buffers_vector(PyObject * container, vector<Py_buffer> & buffers) {
+        container = PySequence_Fast(container, "expected a sequence");
+        if (container == NULL) return false;
+
+        Py_ssize_t num_items = PySequence_Fast_GET_SIZE(container);
+        buffers.reserve(num_items);
+        for (Py_ssize_t i = 0; i < num_items; i++) {
+                Py_buffer buffer;
+                if (! PyArg_Parse(PySequence_Fast_GET_ITEM(container, i), "s*", &buffer)) {
+                        _release_buffers(buffers);
+                        Py_DECREF(container);
+                        return false;
+                }
+                buffers.push_back(buffer);
+        }
+        Py_DECREF(container);
+        return true;
+}
+
+
+/*
+ * Whether `span` is tokenized as text: it matches no term or, as the terms after
+ * the first `keyterms`, the spelling of a term that is not a keyterm.
+ */
+static bool _is_text(Span const & span, int keyterms) {
+        return span.term < 0 || span.term >= keyterms;
+}
+
+
+/*
+ * The index after the spans of the token that starts at `spans[i]`: adjacent
+ * spans of text are a single token, as if the spellings in them were replaced
+ * before tokenizing.
+ */
+static size_t _token_end(vector<Span> const & spans, size_t i, int keyterms) {
+        size_t end = i + 1;
+        if (_is_text(spans[i], keyterms)) {
+                while (end < spans.size() && _is_text(spans[end], keyterms))
+                        end++;
+        }
+        return end;
+}
+
+
+/*
+ * Joins the adjacent spans of text of `spans` into the span of their token (see
+ * `_token_end`).
+ */
+static void _join_text(vector<Span> & spans, int keyterms) {
+        size_t count = 0;
+        for (size_t i = 0, end; i < spans.size(); i = end) {
+                end = _token_end(spans, i, keyterms);
+                spans[count] = spans[i];
+                if (end > i + 1)
+                        spans[count] = Span(spans[i].start, spans[end - 1].end);
+                count++;
         }
+        spans.resize(count, Span(0, 0));
+}
 
+
+static size_t _tokens_count(vector<Span> const & spans, int keyterms) {
+        size_t count = 0;
+        for (size_t i = 0; i < spans.size(); i = _token_end(spans, i, keyterms))
+                count++;
+        return count;
+}
+
+
+/*
+ * Returns the list of strings of the tokens of the `spans` of the (utf-8)
+ * `text`. With `terms`, a tuple with a string per term, tokens that match a
+ * term share its string and spellings inside text are replaced by their term.
+ */
+static PyObject *_tokens_list(char const * text, vector<Span> const & spans,
+                              PyObject * terms=NULL, int keyterms=INT_MAX) {
+        // build the Python list back
+        PyObject *PList = PyList_New(_tokens_count(spans, keyterms));
+        if (PList == NULL) return NULL;
+        size_t token_i = 0;
+        for (size_t i = 0, end; i < spans.size(); i = end, token_i++) {
+                end = _token_end(spans, i, keyterms);
+                PyObject * token;
+                if (end > i + 1) {
+                        string string;
+                        for (size_t j = i; j < end; j++) {
+                                if (terms != NULL && spans[j].term >= 0) {
+                                        Py_ssize_t size;
+                                        char const * term = PyUnicode_AsUTF8AndSize(
+                                                PyTuple_GET_ITEM(terms, spans[j].term), &size);
+                                        if (term == NULL) {
+                                                Py_DECREF(PList);
+                                                return NULL;
+                                        }
+                                        string.append(term, size);
+                                }
+                                else
+                                        string.append(text + spans[j].start, spans[j].size());
+                        }
+                        token = PyUnicode_FromStringAndSize(string.data(), string.size());
+                }
+                else if (terms != NULL && spans[i].term >= 0) {
+                        token = PyTuple_GET_ITEM(terms, spans[i].term);
+                        Py_INCREF(token);
+                }
+                else
+                        token = PyUnicode_FromStringAndSize(text + spans[i].start, spans[i].size());
+                if (token == NULL) {
+                        Py_DECREF(PList);
+                        return NULL;
+                }
+                PyList_SET_ITEM(PList, token_i, token);
+        }
         return PList;
 }
 
 
+/*
+ * Returns the kinds of the tokens of the `spans` as bytes of native `int`s (the
+ * layout of `array('i')`): the kind of the term each token matches, or 0.
+ */
+static PyObject *_kinds_bytes(vector<Span> const & spans, vector<int> const & kinds,
+                              int keyterms) {
+        PyObject * bytes = PyBytes_FromStringAndSize(
+                NULL, _tokens_count(spans, keyterms) * sizeof(int));
+        if (bytes == NULL) return NULL;
+        int * result = (int *) PyBytes_AS_STRING(bytes);
+        for (size_t i = 0, end; i < spans.size(); i = end, result++) {
+                end = _token_end(spans, i, keyterms);
+                *result = end == i + 1 && spans[i].term >= 0 ? kinds[spans[i].term] : 0;
+        }
+        return bytes;
+}
+
+
+/*
+ * Returns the spans as bytes of native `unsigned int`s (the layout of
+ * `array('I')`), [start_0, end_0, start_1, end_1, ...], in code points of the
+ * (utf-8) `text` or, without `code_points`, in bytes.
+ */
+static PyObject *_spans_bytes(char const * text, size_t size, vector<Span> const & spans,
+                              bool code_points) {
+        if (size > UINT_MAX) {
+                PyErr_SetString(PyExc_OverflowError, "string too long for spans");
+                return NULL;
+        }
+        PyObject * bytes = PyBytes_FromStringAndSize(NULL, 2 * spans.size() * sizeof(unsigned int));
+        if (bytes == NULL) return NULL;
+        unsigned int * offsets = (unsigned int *) PyBytes_AS_STRING(bytes);
+
+        if (! code_points) {
+                for (size_t i = 0; i < spans.size(); i++) {
+                        offsets[2 * i] = spans[i].start;
+                        offsets[2 * i + 1] = spans[i].end;
+                }
+                return bytes;
+        }
+
+        // spans are sorted: convert byte offsets to code points in a single pass
+        size_t byte_i = 0;
+        unsigned int char_i = 0;
+        for (size_t i = 0; i < 2 * spans.size(); i++) {
+                size_t offset = i % 2 ? spans[i / 2].end : spans[i / 2].start;
+                for (; byte_i < offset; byte_i++) {
+                        // count all but utf-8 continuation bytes
+                        if ((text[byte_i] & 0xC0) != 0x80)
+                                char_i++;
+                }
+                offsets[i] = char_i;
+        }
+        return bytes;
+}
+
+
+/*
+ * Returns the list of strings of the `tokens` (see `_tokens_list`) or, with
+ * `kinds`, the tuple (strings, kinds of the tokens) (see `_kinds_bytes`).
+ */
+static PyObject *_tokens_result(char const * text, vector<Span> const & tokens,
+                                PyObject * terms, vector<int> const * kinds, int keyterms) {
+        PyObject * strings = _tokens_list(text, tokens, terms, keyterms);
+        if (strings == NULL || kinds == NULL) return strings;
+
+        PyObject * tokens_kinds = _kinds_bytes(tokens, *kinds, keyterms);
+        if (tokens_kinds == NULL) {
+                Py_DECREF(strings);
+                return NULL;
+        }
+        return Py_BuildValue("(NN)", strings, tokens_kinds);
+}
+
+
+/*
+ * Tokenizes a string or the (utf-8) contents of an object with the buffer
+ * protocol, in place and without the GIL; an exported buffer cannot be resized
+ * or closed meanwhile.
+ */
+static PyObject *_tokenize_buffer(Py_buffer & text, Automaton const & automaton,
+                                  PyObject * terms=NULL, vector<int> const * kinds=NULL,
+                                  Stats * stats=NULL) {
+        vector<Span> tokens;
+        Py_BEGIN_ALLOW_THREADS
+        tokens = tokenize((char const *) text.buf, text.len, automaton, stats);
+        Py_END_ALLOW_THREADS
+
+        PyObject * result = _tokens_result((char const *) text.buf, tokens, terms, kinds,
+                                           automaton.keyterms().size());
+        PyBuffer_Release(&text);
+        return result;
+}
+
+
+static PyObject *_tokenize(PyObject *self, PyObject *args) {
+        PyObject * container;
+        Py_buffer text;
+        if (! PyArg_ParseTuple(args, "s*O", &text, &container)) return NULL;
+
+        vector<string> keyterms;
+        if (! _strings_vector(container, keyterms)) {
+                PyBuffer_Release(&text);
+                return NULL;
+        }
+
+        return _tokenize_buffer(text, Automaton(keyterms));
+}
+
+
+/*
+ * Tokenizes all `texts` in one go without the GIL and releases them; returns a
+ * list with the tokens of each text (see `_tokens_result`).
+ */
+static PyObject *_tokenize_many(vector<Py_buffer> & texts, Automaton const & automaton,
+                                PyObject * terms=NULL, vector<int> const * kinds=NULL) {
+        vector<vector<Span> > tokens(texts.size());
+        Py_BEGIN_ALLOW_THREADS
+        for (size_t i = 0; i < texts.size(); i++)
+                tokens[i] = tokenize((char const *) texts[i].buf, texts[i].len, automaton);
+        Py_END_ALLOW_THREADS
+
+        PyObject * result = PyList_New(texts.size());
+        if (result == NULL) {
+                _release_buffers(texts);
+                return NULL;
+        }
+        for (size_t i = 0; i < texts.size(); i++) {
+                PyObject * text_tokens = _tokens_result((char const *) texts[i].buf, tokens[i],
+                                                        terms, kinds,
+                                                        automaton.keyterms().size());
+                if (text_tokens == NULL) {
+                        Py_DECREF(result);
+                        _release_buffers(texts);
+                        return NULL;
+                }
+                PyList_SET_ITEM(result, i, text_tokens);
+        }
+        _release_buffers(texts);
+        return result;
+}
+
+
+static PyObject *_tokenize_many_function(PyObject *self, PyObject *args) {
+        PyObject * texts_container;
+        PyObject * container;
+        if (! PyArg_ParseTuple(args, "OO", &texts_container, &container)) return NULL;
+
+        vector<string> keyterms;
+        if (! _strings_vector(container, keyterms)) return NULL;
+
+        vector<Py_buffer> texts;
+        if (! _buffers_vector(texts_container, texts)) return NULL;
+
+        return _tokenize_many(texts, Automaton(keyterms));
+}
+
+
+/*
+ * Tokenizer: the automaton of a set of keyterms, compiled once and used to
+ * tokenize many strings.
+ */
+typedef struct {
+        PyObject_HEAD
+        Automaton * automaton;
+        PyObject * keyterms;  // tuple of the keyterms, used to pickle
+        PyObject * terms;  // tuple of the terms' strings shared by all tokens
+        vector<int> * kinds;  // the kind of each term
+        PyObject * kinds_function;  // that gave the kinds of the keyterms, or NULL
+        PyObject * spellings;  // dict of other spellings of terms, or None
+        int keep_spelling;  // whether tokens keep the spelling of the text
+} Tokenizer;
+
+
+/*
+ * Converts a Python dict {term: sequence of spellings} to a vector of
+ * (spelling, index of the term). Terms that are not keyterms are appended to
+ * `folded` and indexed after the keyterms. Returns false with an exception set
+ * on failure.
+ */
+static bool _spellings_vector(PyObject * dict, vector<string> const & keyterms,
+                              vector<string> & folded,
+                              vector<pair<string, int> > & spellings) {
+        PyObject * key;
+        PyObject * value;
+        Py_ssize_t pos = 0;
+        while (PyDict_Next(dict, &pos, &key, &value)) {
+                const char * the_string;
+                Py_ssize_t size;
+                if (! PyArg_Parse(key, "s#", &the_string, &size)) return false;
+                string term_string(the_string, size);
+
+                int term_i;
+                vector<string>::const_iterator term = find(keyterms.begin(), keyterms.end(),
+                                                           term_string);
+                if (term != keyterms.end())
+                        term_i = term - keyterms.begin();
+                else {
+                        // not a keyterm: its spellings are replaced inside text
+                        term = find(folded.begin(), folded.end(), term_string);
+                        if (term == folded.end()) {
+                                folded.push_back(term_string);
+                                term = folded.end() - 1;
+                        }
+                        term_i = keyterms.size() + (term - folded.begin());
+                }
+                vector<string> term_spellings;
+                if (! _strings_vector(value, term_spellings)) return false;
+                for (size_t j = 0; j < term_spellings.size(); j++)
+                        spellings.push_back(make_pair(term_spellings[j], term_i));
+        }
+        return true;
+}
+
+
+/*
+ * The strings shared by the tokens of each keyterm or NULL when tokens keep the
+ * spelling of the text.
+ */
+static PyObject *_terms(Tokenizer * self) {
+        return self->keep_spelling ? NULL : self->terms;
+}
+
+
+/*
+ * Converts a Python sequence of `size` integers to a vector of ints or, if
+ * `container` is callable, calls it with each of the `keyterms` (a sequence of
+ * strings) for its kind. Returns false with an exception set on failure.
+ */
+static bool _kinds_vector(PyObject * container, PyObject * keyterms, size_t size,
+                          vector<int> & kinds) {
+        bool is_function = PyCallable_Check(container);
+        PyObject * items = PySequence_Fast(is_function ? keyterms : container,
+                                           "expected a sequence");
+        if (items == NULL) return false;
+
+        if ((size_t) PySequence_Fast_GET_SIZE(items) != size) {
+                PyErr_SetString(PyExc_ValueError, "expected a kind per keyterm");
+                Py_DECREF(items);
+                return false;
+        }
+        kinds.resize(size);
+        for (size_t i = 0; i < size; i++) {
+                PyObject * kind = PySequence_Fast_GET_ITEM(items, i);
+                if (is_function) {
+                        kind = PyObject_CallOneArg(container, kind);
+                        if (kind == NULL) {
+                                Py_DECREF(items);
+                                return false;
+                        }
+                }
+                else
+                        Py_INCREF(kind);
+                kinds[i] = PyLong_AsLong(kind);
+                Py_DECREF(kind);
+                if (kinds[i] == -1 && PyErr_Occurred()) {
+                        Py_DECREF(items);
+                        return false;
+                }
+        }
+        Py_DECREF(items);
+        return true;
+}
+
+
+static PyObject *Tokenizer_new(PyTypeObject *type, PyObject *args, PyObject *kwds) {
+        static const char * kwlist[] = {"keyterms", "kinds", "spellings", "keep_spelling", NULL};
+        PyObject * container;
+        PyObject * kinds_container = Py_None;
+        PyObject * spellings_mapping = Py_None;
+        int keep_spelling = 0;
+        if (! PyArg_ParseTupleAndKeywords(args, kwds, "O|OOp", (char **) kwlist,
+                                          &container, &kinds_container, &spellings_mapping,
+                                          &keep_spelling)) return NULL;
+
+        vector<string> keyterms;
+        if (! _strings_vector(container, keyterms)) return NULL;
+
+        // by default, keyterms are numbered from 1 in their order
+        vector<int> kinds(keyterms.size());
+        for (size_t i = 0; i < keyterms.size(); i++)
+                kinds[i] = i + 1;
+        if (kinds_container != Py_None &&
+            ! _kinds_vector(kinds_container, container, keyterms.size(), kinds)) return NULL;
+
+        // a copy of `spellings_mapping`, used to pickle
+        PyObject * spellings_dict = Py_None;
+        vector<string> folded;
+        vector<pair<string, int> > spellings;
+        if (spellings_mapping != Py_None) {
+                spellings_dict = PyDict_New();
+                if (spellings_dict == NULL) return NULL;
+                if (PyDict_Update(spellings_dict, spellings_mapping) < 0 ||
+                    ! _spellings_vector(spellings_dict, keyterms, folded, spellings)) {
+                        Py_DECREF(spellings_dict);
+                        return NULL;
+                }
+        }
+        else
+                Py_INCREF(Py_None);
+
+        Tokenizer * self = (Tokenizer *) type->tp_alloc(type, 0);
+        if (self == NULL) {
+                Py_DECREF(spellings_dict);
+                return NULL;
+        }
+
+        self->keep_spelling = keep_spelling;
+        self->spellings = spellings_dict;
+        if (PyCallable_Check(kinds_container)) {
+                Py_INCREF(kinds_container);
+                self->kinds_function = kinds_container;
+        }
+
+        self->keyterms = PySequence_Tuple(container);
+        if (self->keyterms == NULL) {
+                Py_DECREF(self);
+                return NULL;
+        }
+        // the spellings of terms that are not keyterms are text: their kind is 0
+        vector<string> terms(keyterms);
+        terms.insert(terms.end(), folded.begin(), folded.end());
+        kinds.resize(terms.size(), 0);
+
+        self->terms = PyTuple_New(terms.size());
+        if (self->terms == NULL) {
+                Py_DECREF(self);
+                return NULL;
+        }
+        for (size_t i = 0; i < terms.size(); i++) {
+                PyObject * term = PyUnicode_FromStringAndSize(terms[i].data(), terms[i].size());
+                if (term == NULL) {
+                        Py_DECREF(self);
+                        return NULL;
+                }
+                PyUnicode_InternInPlace(&term);
+                PyTuple_SET_ITEM(self->terms, i, term);
+        }
+        self->automaton = new Automaton(keyterms, spellings);
+        self->kinds = new vector<int>(kinds);
+        return (PyObject *) self;
+}
+
+
+static void Tokenizer_dealloc(Tokenizer *self) {
+        delete self->automaton;
+        delete self->kinds;
+        Py_XDECREF(self->keyterms);
+        Py_XDECREF(self->terms);
+        Py_XDECREF(self->spellings);
+        Py_XDECREF(self->kinds_function);
+        Py_TYPE(self)->tp_free((PyObject *) self);
+}
+
+
+static PyObject *_stats_dict(Stats const & stats) {
+        return Py_BuildValue("{s:n,s:n,s:n,s:n,s:n,s:n}",
+                             "bytes", (Py_ssize_t) stats.bytes,
+                             "matches", (Py_ssize_t) stats.matches,
+                             "candidates", (Py_ssize_t) stats.candidates,
+                             "prefixes", (Py_ssize_t) stats.prefixes,
+                             "peak_matches", (Py_ssize_t) stats.peak_matches,
+                             "tokens", (Py_ssize_t) stats.tokens);
+}
+
+
+static PyObject *Tokenizer_tokenize(Tokenizer *self, PyObject *args, PyObject *kwds) {
+        static const char * kwlist[] = {"text", "stats", NULL};
+        Py_buffer text;
+        int with_stats = 0;
+        if (! PyArg_ParseTupleAndKeywords(args, kwds, "s*|p", (char **) kwlist,
+                                          &text, &with_stats)) return NULL;
+
+        // the automaton is never changed after built: scan without the GIL
+        if (! with_stats)
+                return _tokenize_buffer(text, *self->automaton, _terms(self));
+
+        Stats stats;
+        PyObject * tokens = _tokenize_buffer(text, *self->automaton, _terms(self), NULL, &stats);
+        if (tokens == NULL) return NULL;
+        PyObject * counters = _stats_dict(stats);
+        if (counters == NULL) {
+                Py_DECREF(tokens);
+                return NULL;
+        }
+        return Py_BuildValue("(NN)", tokens, counters);
+}
+
+
+static PyObject *Tokenizer_tokenize_many(Tokenizer *self, PyObject *args) {
+        PyObject * texts_container;
+        if (! PyArg_ParseTuple(args, "O", &texts_container)) return NULL;
+
+        vector<Py_buffer> texts;
+        if (! _buffers_vector(texts_container, texts)) return NULL;
+
+        return _tokenize_many(texts, *self->automaton, _terms(self));
+}
+
+
+static PyObject *Tokenizer_stream(Tokenizer *self, PyObject *args) {
+        Py_buffer text;
+        if (! PyArg_ParseTuple(args, "s*", &text)) return NULL;
+
+        return _tokenize_buffer(text, *self->automaton, _terms(self), self->kinds);
+}
+
+
+static PyObject *Tokenizer_stream_many(Tokenizer *self, PyObject *args) {
+        PyObject * texts_container;
+        if (! PyArg_ParseTuple(args, "O", &texts_container)) return NULL;
+
+        vector<Py_buffer> texts;
+        if (! _buffers_vector(texts_container, texts)) return NULL;
+
+        return _tokenize_many(texts, *self->automaton, _terms(self), self->kinds);
+}
+
+
+static PyObject *Tokenizer_spans(Tokenizer *self, PyObject *args) {
+        Py_buffer text;
+        if (! PyArg_ParseTuple(args, "s*", &text)) return NULL;
+
+        vector<Span> spans;
+        Py_BEGIN_ALLOW_THREADS
+        spans = tokenize((char const *) text.buf, text.len, *self->automaton);
+        _join_text(spans, self->automaton->keyterms().size());
+        Py_END_ALLOW_THREADS
+
+        // offsets of strings are in code points, of buffers in bytes
+        PyObject * result = _spans_bytes((char const *) text.buf, text.len, spans,
+                                         PyUnicode_Check(text.obj));
+        PyBuffer_Release(&text);
+        return result;
+}
+
+
+static PyObject *Tokenizer_get_kinds(Tokenizer *self, void *closure) {
+        // the kinds of the keyterms, without those of the other spelled terms
+        Py_ssize_t size = PyTuple_GET_SIZE(self->keyterms);
+        PyObject * kinds = PyTuple_New(size);
+        if (kinds == NULL) return NULL;
+        for (Py_ssize_t i = 0; i < size; i++) {
+                PyObject * kind = PyLong_FromLong((*self->kinds)[i]);
+                if (kind == NULL) {
+                        Py_DECREF(kinds);
+                        return NULL;
+                }
+                PyTuple_SET_ITEM(kinds, i, kind);
+        }
+        return kinds;
+}
+
+
+static PyObject *Tokenizer_reduce(Tokenizer *self, PyObject *ignored) {
+        // its arguments are all it takes to build it again; kinds given by a
+        // function (e.g. a registry) are asked to it again where it is unpickled
+        PyObject * kinds = self->kinds_function;
+        if (kinds != NULL)
+                Py_INCREF(kinds);
+        else
+                kinds = Tokenizer_get_kinds(self, NULL);
+        if (kinds == NULL) return NULL;
+        return Py_BuildValue("O(ONOO)", Py_TYPE(self), self->keyterms, kinds, self->spellings,
+                             self->keep_spelling ? Py_True : Py_False);
+}
+
+
+static PyObject *Tokenizer_get_keyterms(Tokenizer *self, void *closure) {
+        Py_INCREF(self->keyterms);
+        return self->keyterms;
+}
+
+
+static PyMethodDef Tokenizer_methods[] = {
+        {"tokenize", (PyCFunction) Tokenizer_tokenize, METH_VARARGS | METH_KEYWORDS,
+         "tokenize(text, stats=False)\n\n"
+         "Tokenizes a string or utf-8 buffer guaranteeing that the keyterms are "
+         "preserved. With `stats`, returns the tuple (tokens, dict of counters of "
+         "the work done: bytes, matches, candidates, prefixes, peak_matches and "
+         "tokens)."},
+        {"tokenize_many", (PyCFunction) Tokenizer_tokenize_many, METH_VARARGS,
+         "Tokenizes a sequence of strings; returns the list of tokens of each."},
+        {"stream", (PyCFunction) Tokenizer_stream, METH_VARARGS,
+         "Tokenizes a string like `tokenize`; returns the tuple (tokens, bytes "
+         "of the `int` kind of each token)."},
+        {"stream_many", (PyCFunction) Tokenizer_stream_many, METH_VARARGS,
+         "Tokenizes a sequence of strings; returns the `stream` of each."},
+        {"spans", (PyCFunction) Tokenizer_spans, METH_VARARGS,
+         "Tokenizes a string into bytes of `unsigned int` (start, end) offsets "
+         "of its tokens, in code points for strings and in bytes for buffers."},
+        {"__reduce__", (PyCFunction) Tokenizer_reduce, METH_NOARGS, NULL},
+        {NULL, NULL, 0, NULL}
+};
+
+
+static PyGetSetDef Tokenizer_getset[] = {
+        {"keyterms", (getter) Tokenizer_get_keyterms, NULL,
+         "The keyterms this tokenizer preserves.", NULL},
+        {"kinds", (getter) Tokenizer_get_kinds, NULL,
+         "The kind of each keyterm.", NULL},
+        {NULL, NULL, NULL, NULL, NULL}
+};
+
+
+static PyTypeObject TokenizerType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        "pt_law_parser._tokenizer.Tokenizer",  /* tp_name */
+        sizeof(Tokenizer),                     /* tp_basicsize */
+};
+
+
+/*
+ * StreamTokenizer: tokenizes a text given in chunks with a `Tokenizer`.
+ */
+typedef struct {
+        PyObject_HEAD
+        Tokenizer * tokenizer;
+        Scanner * scanner;
+        string * buffer;  // the text not yet yielded
+        vector<Span> * pending;  // spans of text at the end of `buffer`, not yet yielded
+} StreamTokenizer;
+
+
+static PyObject *StreamTokenizer_new(PyTypeObject *type, PyObject *args, PyObject *kwds) {
+        static const char * kwlist[] = {"tokenizer", NULL};
+        PyObject * tokenizer;
+        if (! PyArg_ParseTupleAndKeywords(args, kwds, "O!", (char **) kwlist,
+                                          &TokenizerType, &tokenizer)) return NULL;
+
+        StreamTokenizer * self = (StreamTokenizer *) type->tp_alloc(type, 0);
+        if (self == NULL) return NULL;
+
+        Py_INCREF(tokenizer);
+        self->tokenizer = (Tokenizer *) tokenizer;
+        self->scanner = new Scanner(*self->tokenizer->automaton);
+        self->buffer = new string();
+        self->pending = new vector<Span>();
+        return (PyObject *) self;
+}
+
+
+static void StreamTokenizer_dealloc(StreamTokenizer *self) {
+        delete self->scanner;
+        delete self->buffer;
+        delete self->pending;
+        Py_XDECREF(self->tokenizer);
+        Py_TYPE(self)->tp_free((PyObject *) self);
+}
+
+
+static PyObject *_stream_scan(StreamTokenizer *self, bool close) {
+        int keyterms = self->tokenizer->automaton->keyterms().size();
+        vector<Span> spans(*self->pending);
+        self->scanner->scan(self->buffer->data(), self->buffer->size(), spans, close);
+
+        // text at the end may still be joined with the text that follows it
+        size_t complete = spans.size();
+        while (! close && complete > 0 && _is_text(spans[complete - 1], keyterms))
+                complete--;
+        self->pending->assign(spans.begin() + complete, spans.end());
+        spans.resize(complete, Span(0, 0));
+
+        PyObject * tokens = _tokens_list(self->buffer->data(), spans, _terms(self->tokenizer),
+                                         keyterms);
+
+        // forget the text that was yielded
+        size_t start = self->pending->empty() ?
+                self->scanner->start() : self->pending->front().start;
+        self->buffer->erase(0, start);
+        self->scanner->shift(start);
+        for (vector<Span>::iterator span = self->pending->begin(); span != self->pending->end(); ++span) {
+                span->start -= start;
+                span->end -= start;
+        }
+        return tokens;
+}
+
+
+/*
+ * A StreamTokenizer changes on every call; without the GIL (free-threaded
+ * builds), calls on the same object are serialized by a critical section.
+ */
+#if PY_VERSION_HEX < 0x030D0000
+// there are no free-threaded builds before 3.13: the GIL serializes the calls
+#define Py_BEGIN_CRITICAL_SECTION(op) {
+#define Py_END_CRITICAL_SECTION() }
+#endif
+
+
+static PyObject *StreamTokenizer_feed(StreamTokenizer *self, PyObject *args) {
+        Py_buffer chunk;
+        if (! PyArg_ParseTuple(args, "s*", &chunk)) return NULL;
+
+        PyObject * tokens = NULL;
+        Py_BEGIN_CRITICAL_SECTION(self);
+        if (self->scanner == NULL)
+                PyErr_SetString(PyExc_ValueError, "feed() after close()");
+        else {
+                self->buffer->append((char const *) chunk.buf, chunk.len);
+                tokens = _stream_scan(self, false);
+        }
+        Py_END_CRITICAL_SECTION();
+        PyBuffer_Release(&chunk);
+        return tokens;
+}
+
+
+static PyObject *StreamTokenizer_close(StreamTokenizer *self, PyObject *ignored) {
+        PyObject * tokens = NULL;
+        Py_BEGIN_CRITICAL_SECTION(self);
+        if (self->scanner == NULL)
+                PyErr_SetString(PyExc_ValueError, "close() after close()");
+        else {
+                tokens = _stream_scan(self, true);
+                delete self->scanner;
+                self->scanner = NULL;
+        }
+        Py_END_CRITICAL_SECTION();
+        return tokens;
+}
+
+
+static PyMethodDef StreamTokenizer_methods[] = {
+        {"feed", (PyCFunction) StreamTokenizer_feed, METH_VARARGS,
+         "Adds a chunk of text; returns the tokens that are complete."},
+        {"close", (PyCFunction) StreamTokenizer_close, METH_NOARGS,
+         "Ends the text; returns the remaining tokens."},
+        {NULL, NULL, 0, NULL}
+};
+
+
+static PyTypeObject StreamTokenizerType = {
+        PyVarObject_HEAD_INIT(NULL, 0)
+        "pt_law_parser._tokenizer.StreamTokenizer",  /* tp_name */
+        sizeof(StreamTokenizer),                     /* tp_basicsize */
+};
+
+
 static PyMethodDef Methods[] = {
         {"tokenize", _tokenize, METH_VARARGS,
          "Tokenizes a string guaranteeing that tokens in the set are preserved."},
+        {"tokenize_many", _tokenize_many_function, METH_VARARGS,
+         "Tokenizes a sequence of strings; returns the list of tokens of each."},
         {NULL, NULL, 0, NULL}
 };
 
@@ -60,5 +823,46 @@ static struct PyModuleDef module = {
 PyMODINIT_FUNC
 PyInit__tokenizer(void)
 {
-        return PyModule_Create(&module);
+        TokenizerType.tp_dealloc = (destructor) Tokenizer_dealloc;
+        TokenizerType.tp_flags = Py_TPFLAGS_DEFAULT;
+        TokenizerType.tp_doc = "Tokenizer(keyterms, kinds=None, spellings=None, keep_spelling=False): "
+                "keyterms compiled once to tokenize many strings. `kinds` are the integers "
+                "`stream` gives to the tokens of each keyterm, or a function returning the "
+                "kind of a keyterm, called again when unpickled; by default 1, 2, ...; other "
+                "tokens are 0. `spellings` maps terms to other spellings of them (e.g. "
+                "in uppercase), tokenized as the term unless `keep_spelling`; the spellings "
+                "of a term that is not a keyterm are replaced by it inside the text around "
+                "them, of kind 0.";
+        TokenizerType.tp_methods = Tokenizer_methods;
+        TokenizerType.tp_getset = Tokenizer_getset;
+        TokenizerType.tp_new = Tokenizer_new;
+        if (PyType_Ready(&TokenizerType) < 0) return NULL;
+
+        StreamTokenizerType.tp_dealloc = (destructor) StreamTokenizer_dealloc;
+        StreamTokenizerType.tp_flags = Py_TPFLAGS_DEFAULT;
+        StreamTokenizerType.tp_doc = "StreamTokenizer(tokenizer): tokenizes a text given in chunks.";
+        StreamTokenizerType.tp_methods = StreamTokenizer_methods;
+        StreamTokenizerType.tp_new = StreamTokenizer_new;
+        if (PyType_Ready(&StreamTokenizerType) < 0) return NULL;
+
+        PyObject * m = PyModule_Create(&module);
+        if (m == NULL) return NULL;
+#ifdef Py_GIL_DISABLED
+        // all state is either immutable or guarded by a critical section
+        PyUnstable_Module_SetGIL(m, Py_MOD_GIL_NOT_USED);
+#endif
+
+        Py_INCREF(&TokenizerType);
+        if (PyModule_AddObject(m, "Tokenizer", (PyObject *) &TokenizerType) < 0) {
+                Py_DECREF(&TokenizerType);
+                Py_DECREF(m);
+                return NULL;
+        }
+        Py_INCREF(&StreamTokenizerType);
+        if (PyModule_AddObject(m, "StreamTokenizer", (PyObject *) &StreamTokenizerType) < 0) {
+                Py_DECREF(&StreamTokenizerType);
+                Py_DECREF(m);
+                return NULL;
+        }
+        return m;
 }
@@ -1,137 +1,369 @@
 #include <string>
 #include <vector>
 #include <map>
-#include <set>
-#include <assert.h>
+#include <algorithm>
+#include <utility>
 
 using namespace std;
 
-typedef map<string, string> string_map;
-typedef map<string, set<string> > string_set_map;
 
-pair<string, string> rsplit(string const & sequence, string const & term) {
-    string prefix = sequence.substr(0, sequence.rfind(term));
-    string suffix = sequence.substr(sequence.rfind(term) + term.size(), sequence.size());
-    return pair<string, string>(prefix, suffix);
-}
+/*
+ * A multi-pattern automaton (Aho-Corasick) built once from a list of keyterms
+ * and, optionally, other spellings of terms (e.g. in uppercase), each with the
+ * index of the term it is tokenized as.
+ *
+ * The automaton is a trie of the keyterms' bytes plus failure links, compiled
+ * into a dense transition table so that each byte of the text costs a single
+ * lookup, independently of the number of keyterms. To keep the table small,
+ * bytes are mapped to classes: all bytes that do not appear in any keyterm share
+ * the class 0, which always leads to the root.
+ */
+class Automaton {
+public:
+    explicit Automaton(vector<string> const & keyterms,
+                       vector<pair<string, int> > const & spellings=vector<pair<string, int> >()) :
+            _keyterms(keyterms) {
+        // the keyterms followed by the spellings; keyterms take precedence
+        vector<pair<string, int> > patterns;
+        for (unsigned int term_i = 0; term_i < keyterms.size(); term_i++)
+            patterns.push_back(make_pair(keyterms[term_i], term_i));
+        patterns.insert(patterns.end(), spellings.begin(), spellings.end());
 
-bool startswith(string const & a, string const & b) {
-    return a.compare(0, b.length(), b) == 0;
-}
+        for (unsigned int c = 0; c < 256; c++)
+            _byte_class[c] = 0;
+        _classes = 1;
+        for (unsigned int pattern_i = 0; pattern_i < patterns.size(); pattern_i++) {
+            string const & term = patterns[pattern_i].first;
+            for (unsigned int char_i = 0; char_i < term.size(); char_i++) {
+                unsigned char c = term[char_i];
+                if (!_byte_class[c])
+                    _byte_class[c] = _classes++;
+            }
+        }
 
-vector<string> tokenize(string const & text, vector<string> const & keyterms) {
-
-    vector<string> result;
-    string_set_map string_usages;
-    string_map usages;
-    set<string> matches;
-
-    string sequence;
-    for(unsigned int char_i = 0; char_i < text.size(); char_i++) {
-        char character = text[char_i];
-        sequence += character;
-
-        for(unsigned int term_i = 0; term_i < keyterms.size(); term_i++) {
-            string const & term = keyterms[term_i];
-            string current_string = string(1, character);
-
-            string_map::const_iterator term_usage = usages.find(term);
-            if (term_usage != usages.end())
-                current_string = term_usage->second + current_string;
-
-            set<string>::const_iterator term_match = matches.find(term);
-            // if term not in matches
-            if (term_match == matches.end()) {
-                // if term.startswith(current_string)
-                if (startswith(term, current_string)) {
-                    // the term uses current_string; update the references list to current_string.
-
-                    // if term in usages
-                    if (term_usage != usages.end()) {
-                        string_usages[term_usage->second].erase(term);
-                        if (string_usages[term_usage->second].empty())
-                            string_usages.erase(term_usage->second);
-                    }
-                    usages[term] = current_string;
-                    string_usages[current_string].insert(term);
-                }
-                else { // failed to match current_string
-                    // clean references
-                    if (term_usage != usages.end()) {
-                        string_usages[term_usage->second].erase(term);
-                        if (string_usages[term_usage->second].empty())
-                            string_usages.erase(term_usage->second);
-                        usages.erase(term);
-                    }
+        // build the trie
+        vector<map<int, int> > children(1);
+        _add_node(0);
+        for (unsigned int pattern_i = 0; pattern_i < patterns.size(); pattern_i++) {
+            string const & term = patterns[pattern_i].first;
+            if (term.empty())
+                continue;
+            int node = 0;
+            for (unsigned int char_i = 0; char_i < term.size(); char_i++) {
+                int c = _byte_class[(unsigned char) term[char_i]];
+                map<int, int>::const_iterator child = children[node].find(c);
+                if (child == children[node].end()) {
+                    int new_node = _depth.size();
+                    _add_node(_depth[node] + 1);
+                    children.push_back(map<int, int>());
+                    children[node][c] = new_node;
+                    node = new_node;
                 }
+                else
+                    node = child->second;
             }
+            if (_term[node] < 0)
+                _term[node] = patterns[pattern_i].second;
+        }
+
+        // breadth-first: failure links, outputs and the dense transition table
+        _delta.assign(_depth.size() * _classes, 0);
+        vector<int> & fail = _fail;
+        fail.assign(_depth.size(), 0);
+        vector<int> queue(1, 0);
+        for (unsigned int queue_i = 0; queue_i < queue.size(); queue_i++) {
+            int node = queue[queue_i];
 
-            if (term == current_string) {
-                matches.insert(term);
+            if (node != 0) {
+                int f = fail[node];
+                _output[node] = _term[f] >= 0 ? f : _output[f];
+                _alive[node] = children[node].empty() ? _alive[f] : _depth[node];
             }
-        } // for (string term : keyterms)
-
-        // pick the longest candidate, if any
-        string candidate;
-        for (set<string>::const_iterator it = matches.begin(); it != matches.end(); ++it) {
-            string const& match = *it;
-            assert(string_usages.count(match) == 1);
-            assert(usages.count(match) == 1);
-            if (string_usages[match].size() > 1)
-                continue;
-            bool invalid = false;
-            for (string_set_map::const_iterator string_usage = string_usages.begin(); string_usage != string_usages.end(); string_usage++) {
-                if (string_usage->first != match and string_usage->first.find(match) != string::npos) {
-                    invalid = true;
-                    break;
+            else
+                _alive[node] = 0;
+
+            for (int c = 1; c < _classes; c++) {
+                map<int, int>::const_iterator child = children[node].find(c);
+                if (child != children[node].end()) {
+                    int next = child->second;
+                    fail[next] = node == 0 ? 0 : _delta[fail[node] * _classes + c];
+                    _delta[node * _classes + c] = next;
+                    queue.push_back(next);
                 }
+                else if (node != 0)
+                    _delta[node * _classes + c] = _delta[fail[node] * _classes + c];
             }
-            if (invalid)
-                continue;
+        }
+    }
+
+    int next(int state, unsigned char c) const {
+        return _delta[state * _classes + _byte_class[c]];
+    }
+
+    // the length of the keyterm prefix that `state` represents.
+    size_t depth(int state) const {
+        return _depth[state];
+    }
+
+    // the state of the longest proper suffix of `state`.
+    int fail(int state) const {
+        return _fail[state];
+    }
+
+    // the index of the keyterm that ends at `state`, or -1.
+    int term(int state) const {
+        return _term[state];
+    }
+
+    // the next state in the suffix chain of `state` that ends a keyterm, or -1.
+    int output(int state) const {
+        return _output[state];
+    }
+
+    // the length of the longest suffix of `state` that can still grow into a
+    // keyterm.
+    size_t alive(int state) const {
+        return _alive[state];
+    }
+
+    vector<string> const & keyterms() const {
+        return _keyterms;
+    }
+
+private:
+    void _add_node(size_t depth) {
+        _depth.push_back(depth);
+        _term.push_back(-1);
+        _output.push_back(-1);
+        _alive.push_back(0);
+    }
+
+    vector<string> _keyterms;
+    int _byte_class[256];
+    int _classes;
+    vector<int> _delta;
+    vector<int> _fail;
+    vector<size_t> _depth;
+    vector<int> _term;
+    vector<int> _output;
+    vector<size_t> _alive;
+};
+
+
+/*
+ * The byte offsets [start, end) of a token in the text and the index of the
+ * keyterm it matches, or -1.
+ */
+struct Span {
+    size_t start;
+    size_t end;
+    int term;
+
+    Span(size_t start, size_t end, int term=-1) : start(start), end(end), term(term) {}
+
+    size_t size() const {
+        return end - start;
+    }
+};
 
-            if (match.size() > candidate.size())
-                candidate = match;
+
+/*
+ * Counters of the work done by a `Scanner`, to find why a text is slow to
+ * tokenize.
+ */
+struct Stats {
+    size_t bytes;  // bytes of text scanned
+    size_t matches;  // keyterm matches found
+    size_t candidates;  // matches checked for being the next to yield
+    size_t prefixes;  // texts before a match split by the matches inside them
+    size_t peak_matches;  // most matches waiting at once
+    size_t tokens;  // tokens yielded
+
+    Stats() : bytes(0), matches(0), candidates(0), prefixes(0), peak_matches(0),
+        tokens(0) {}
+};
+
+
+/*
+ * Tokenizes a text guaranteeing that keyterms are preserved. The text can be
+ * given incrementally: `scan` yields the tokens that are already complete and
+ * resumes where it stopped on the next call.
+ *
+ * A keyterm match is only yielded when no longer keyterm containing it can still
+ * match; when several are ready, the longest is yielded (the left-most on ties).
+ * The matches before it are then yielded by the same priority, skipping those
+ * that overlap a match already yielded.
+ *
+ * Every byte of the text is read once: the automaton never goes back, and the
+ * matches are kept only while a longer keyterm containing them can still match,
+ * i.e. at most the length of the longest keyterm.
+ */
+class Scanner {
+public:
+    // with `stats`, counts the work done in it.
+    Scanner(Automaton const & automaton, Stats * stats=NULL) :
+        _automaton(automaton), _start(0), _state(0), _char_i(0), _stats(stats) {}
+
+    /*
+     * Scans the (utf-8) text[:end] from where it stopped, appending to `result`
+     * the spans of the tokens that are complete. With `close`, the text ends at
+     * `end` and all the remaining tokens are appended.
+     */
+    void scan(char const * text, size_t end, vector<Span> & result, bool close) {
+        size_t tokens = result.size();
+        if (_stats && end > _char_i)
+            _stats->bytes += end - _char_i;
+
+        for (; _char_i < end; ) {
+            _state = _automaton.next(_state, text[_char_i]);
+            _char_i++;
+            for (int s = _automaton.term(_state) >= 0 ? _state : _automaton.output(_state);
+                 s >= 0; s = _automaton.output(s))
+                _matches.push_back(Span(_char_i - _automaton.depth(s), _char_i, _automaton.term(s)));
+            if (!_matches.empty()) {
+                if (_stats)
+                    _count_matches();
+                _resolve(result);
+            }
+        }
+
+        if (close) {
+            _state = 0;  // at the end of text no keyterm can grow further
+            _resolve(result);
+            if (_start < end)
+                result.push_back(Span(_start, end));
+            _start = end;
         }
+        if (_stats)
+            _stats->tokens += result.size() - tokens;
+    }
+
+    // begin of the text not yet yielded.
+    size_t start() const {
+        return _start;
+    }
+
+    // moves all positions `offset` to the left, after text[:offset] is dropped.
+    void shift(size_t offset) {
+        _start -= offset;
+        _char_i -= offset;
+        for (vector<Span>::iterator match = _matches.begin(); match != _matches.end(); ++match) {
+            match->start -= offset;
+            match->end -= offset;
+        }
+    }
+
+private:
+    // whether `a` is yielded before `b` when both are ready.
+    static bool _precedes(Span const & a, Span const & b) {
+        return a.size() > b.size() || (a.size() == b.size() && a.start < b.start);
+    }
+
+    static bool _before(Span const & a, Span const & b) {
+        return a.start < b.start;
+    }
+
+    // counts the matches found at `_char_i`.
+    void _count_matches() {
+        for (vector<Span>::const_reverse_iterator match = _matches.rbegin();
+             match != _matches.rend() && match->end == _char_i; ++match)
+            _stats->matches++;
+        _stats->peak_matches = max(_stats->peak_matches, _matches.size());
+    }
 
-        if (candidate.size()) {
-            string const &term = candidate;
-            pair<string, string> split = rsplit(sequence, term);
-            string prefix = split.first;
-            string suffix = split.second;
+    // yields the matches that no longer keyterm can contain anymore.
+    void _resolve(vector<Span> & result) {
+        while (!_matches.empty()) {
+            // matches starting after `frontier` may be part of a longer keyterm
+            size_t frontier = _char_i - _automaton.alive(_state);
+            if (_stats)
+                _stats->candidates += _matches.size();
 
-            if (prefix.size() > 0) {
-                vector<string> prefix_result = tokenize(prefix, keyterms);
-                // copy prefix_result to result.
-                result.insert(result.end(), prefix_result.begin(), prefix_result.end());
+            vector<Span>::const_iterator candidate = _matches.end();
+            for (vector<Span>::const_iterator match = _matches.begin(); match != _matches.end(); ++match) {
+                if (match->start < frontier &&
+                    (candidate == _matches.end() || _precedes(*match, *candidate)))
+                    candidate = match;
             }
+            if (candidate == _matches.end())
+                return;
+
+            Span term = *candidate;
+            _yield_until(term.start, result);
             result.push_back(term);
+            _start = term.end;
 
-            // remove all usages that were part of the yielded in term
-            string_set_map copy_string_usages(string_usages); // a copy because we change `string_usages`
-            for (string_set_map::const_iterator string_usage = copy_string_usages.begin(); string_usage != copy_string_usages.end(); string_usage++) {
-                if (term.find(string_usage->first) != string::npos) {
-                    for (set<string>::const_iterator usage = string_usage->second.begin(); usage != string_usage->second.end(); usage++)
-                        usages.erase(*usage);
-                    string_usages.erase(string_usage->first);
-                }
-                if (matches.count(string_usage->first))
-                    matches.erase(string_usage->first);
+            // forget everything that started before the end of `term`
+            size_t remaining = 0;
+            for (size_t match_i = 0; match_i < _matches.size(); match_i++) {
+                if (_matches[match_i].start >= term.end)
+                    _matches[remaining++] = _matches[match_i];
             }
-            sequence = suffix;
+            _matches.resize(remaining, term);
+            while (_automaton.depth(_state) > _char_i - _start)
+                _state = _automaton.fail(_state);
         }
     }
 
-    for (set<string>::const_iterator it = matches.begin(); it != matches.end(); ++it) {
-        string const& match = *it;
-        pair<string, string> split = rsplit(sequence, match);
-        string prefix = split.first;
-        string suffix = split.second;
-        result.push_back(prefix);
-        result.push_back(match);
-        sequence = suffix;
+    // yields text[_start:end] using the matches that are inside it.
+    void _yield_until(size_t end, vector<Span> & result) {
+        vector<Span> inside;
+        for (vector<Span>::const_iterator match = _matches.begin(); match != _matches.end(); ++match) {
+            if (match->end <= end)
+                inside.push_back(*match);
+        }
+        if (inside.empty()) {
+            if (end > _start)
+                result.push_back(Span(_start, end));
+            _start = end;
+            return;
+        }
+        if (_stats)
+            _stats->prefixes++;
+
+        // by priority, keep the matches that do not overlap a kept one
+        sort(inside.begin(), inside.end(), _precedes);
+        vector<Span> kept;
+        for (vector<Span>::const_iterator match = inside.begin(); match != inside.end(); ++match) {
+            bool overlaps = false;
+            for (vector<Span>::const_iterator other = kept.begin(); other != kept.end(); ++other) {
+                if (match->start < other->end && other->start < match->end) {
+                    overlaps = true;
+                    break;
+                }
+            }
+            if (!overlaps)
+                kept.push_back(*match);
+        }
+        sort(kept.begin(), kept.end(), _before);
+
+        for (vector<Span>::const_iterator match = kept.begin(); match != kept.end(); ++match) {
+            if (match->start > _start)
+                result.push_back(Span(_start, match->start));
+            result.push_back(*match);
+            _start = match->end;
+        }
+        if (end > _start)
+            result.push_back(Span(_start, end));
+        _start = end;
     }
-    if (sequence.size())
-        result.push_back(sequence);
 
-    return result;
+    Automaton const & _automaton;
+    vector<Span> _matches;  // found after `_start`, not yet yielded
+    size_t _start;
+    int _state;
+    size_t _char_i;
+    Stats * _stats;
 };
+
+
+/*
+ * Tokenizes the `size` bytes of `text` in place, counting the work in `stats`,
+ * if given.
+ */
+vector<Span> tokenize(char const * text, size_t size, Automaton const & automaton,
+                      Stats * stats=NULL) {
+    vector<Span> result;
+    Scanner(automaton, stats).scan(text, size, result, true);
+    return result;
+}
@@ -1,7 +1,227 @@
+from array import array
+
 from pt_law_parser import _tokenizer
+from pt_law_parser._tokenizer import Tokenizer, StreamTokenizer
+
+from pt_law_parser.expressions import Token, register_kind
+
+
+# The `Token`s shared by all tokenizations, by string. It is bounded: once full,
+# or for long strings, `intern_token` returns new `Token`s.
+_interned = {}
+MAX_INTERNED = 10000
+MAX_INTERNED_LENGTH = 40
+
+
+def intern_token(string):
+    """
+    Returns the `Token` of `string`, the same object for every occurrence of
+    `string`. Since they are shared, `Token`s must never be changed.
+    """
+    token = _interned.get(string)
+    if token is None:
+        token = Token(string)
+        if len(_interned) < MAX_INTERNED and len(string) <= MAX_INTERNED_LENGTH:
+            _interned[string] = token
+    return token
 
-from pt_law_parser.expressions import Token
+
+def case_spellings(string, limit=4096):
+    """
+    Returns the spellings of `string` in any case, to match it ignoring case with
+    the `spellings` of a `Tokenizer`. Raises `ValueError` if there are more than
+    `limit` of them.
+    """
+    cases = [sorted({char, char.lower(), char.upper()}) for char in string]
+    count = 1
+    for char_cases in cases:
+        count *= len(char_cases)
+    if count > limit:
+        raise ValueError('%r has %d spellings, more than %d' % (string, count, limit))
+
+    spellings = ['']
+    for char_cases in cases:
+        spellings = [spelling + case for spelling in spellings for case in char_cases]
+    return spellings
+
+
+def _tokens(strings):
+    get = _interned.get
+    return [get(string) or intern_token(string) for string in strings]
 
 
 def tokenize(string, keyterms=()):
-    return [Token(token) for token in _tokenizer.tokenize(string, keyterms)]
+    """
+    Tokenizes `string` into `Token`s preserving `keyterms`, which is either a
+    sequence of strings or a compiled `Tokenizer`. Equal tokens are the same
+    object (see `intern_token`).
+
+    `string` can also be utf-8 text in any object with the buffer protocol (e.g.
+    `bytes`, `memoryview` or `mmap.mmap`), which is read in place.
+    """
+    if isinstance(keyterms, Tokenizer):
+        tokens = keyterms.tokenize(string)
+    else:
+        tokens = _tokenizer.tokenize(string, keyterms)
+    return _tokens(tokens)
+
+
+def tokenize_many(strings, keyterms=()):
+    """
+    Tokenizes each string of `strings` like `tokenize`, all in a single call to
+    the extension. Returns a list with the list of `Token`s of each string.
+    """
+    if isinstance(keyterms, Tokenizer):
+        strings_tokens = keyterms.tokenize_many(strings)
+    else:
+        strings_tokens = _tokenizer.tokenize_many(strings, keyterms)
+    return [_tokens(tokens) for tokens in strings_tokens]
+
+
+def iter_tokenize(chunks, keyterms=()):
+    """
+    Tokenizes the concatenation of the strings in `chunks` like `tokenize`,
+    yielding each `Token` as soon as no longer keyterm can change it. Only the
+    text of the tokens not yet yielded is kept in memory.
+
+    Chunks can also be utf-8 buffers, split at any byte.
+    """
+    if not isinstance(keyterms, Tokenizer):
+        keyterms = Tokenizer(keyterms)
+    stream = StreamTokenizer(keyterms)
+    for chunk in chunks:
+        for token in stream.feed(chunk):
+            yield intern_token(token)
+    for token in stream.close():
+        yield intern_token(token)
+
+
+def _kinds_tokenizer(keyterms):
+    """
+    Returns a `Tokenizer` of `keyterms` whose kinds are the registered kinds (see
+    `expressions.register_kind`).
+    """
+    if isinstance(keyterms, Tokenizer):
+        return keyterms
+    keyterms = list(keyterms)
+    return Tokenizer(keyterms, register_kind)
+
+
+def tokenize_stream(string, keyterms=()):
+    """
+    Tokenizes `string` like `tokenize`, but into a `TokenStream`. A `Tokenizer`
+    given as `keyterms` must be built with the registered kinds of its keyterms.
+    """
+    return TokenStream(*_kinds_tokenizer(keyterms).stream(string))
+
+
+def tokenize_stream_many(strings, keyterms=()):
+    """
+    Tokenizes each string of `strings` like `tokenize_stream`, all in a single
+    call to the extension. Returns a list with the `TokenStream` of each string.
+    """
+    return [TokenStream(*stream)
+            for stream in _kinds_tokenizer(keyterms).stream_many(strings)]
+
+
+def tokenize_spans(string, keyterms=()):
+    """
+    Tokenizes `string` like `tokenize`, but into a `TokenSpans`. The offsets are
+    in code points for a `str` and in bytes for a buffer.
+    """
+    if not isinstance(keyterms, Tokenizer):
+        keyterms = Tokenizer(keyterms)
+    spans = array('I')
+    spans.frombytes(keyterms.spans(string))
+    return TokenSpans(string, spans)
+
+
+class TokenStream(object):
+    """
+    A sequence of the tokens of a text, stored as their strings and an
+    `array('i')` of their kinds: the kind of the keyterm each token matches, or
+    `TEXT` for the text between keyterms. `Token`s are only built when indexing
+    or iterating it.
+    """
+    def __init__(self, strings, kinds):
+        self._strings = strings
+        self._kinds = array('i')
+        self._kinds.frombytes(kinds)
+
+    def __len__(self):
+        return len(self._strings)
+
+    def __getitem__(self, index):
+        return intern_token(self._strings[index])
+
+    def __iter__(self):
+        return iter(_tokens(self._strings))
+
+    @property
+    def strings(self):
+        return self._strings
+
+    @property
+    def kinds(self):
+        return self._kinds
+
+
+class TokenSpans(object):
+    """
+    A lazy sequence of the tokens of `text`, stored as their (start, end) offsets
+    in an `array('I')` of the form [start_0, end_0, start_1, end_1, ...]. Strings
+    are only built by `as_str` and `Token`s by indexing it.
+
+    `text` is either a `str` or utf-8 text in an object with the buffer protocol,
+    which is decoded token by token.
+    """
+    def __init__(self, text, spans):
+        self._text = text
+        self._spans = spans
+        self._is_str = isinstance(text, str)
+
+    def __len__(self):
+        return len(self._spans) // 2
+
+    def __getitem__(self, index):
+        return intern_token(self.as_str(index))
+
+    def __iter__(self):
+        if not self._is_str:
+            for i in range(len(self)):
+                yield self[i]
+            return
+        text = self._text
+        spans = self._spans
+        for i in range(0, len(spans), 2):
+            yield intern_token(text[spans[i]:spans[i + 1]])
+
+    @property
+    def text(self):
+        return self._text
+
+    @property
+    def spans(self):
+        return self._spans
+
+    def start(self, index):
+        return self._spans[2 * index]
+
+    def end(self, index):
+        return self._spans[2 * index + 1]
+
+    def as_str(self, index):
+        string = self._text[self._spans[2 * index]:self._spans[2 * index + 1]]
+        if self._is_str:
+            return string
+        return str(string, 'utf-8')
+
+    def equals(self, index, string):
+        """
+        Returns whether the token at `index` is `string` without building it.
+        """
+        start = self._spans[2 * index]
+        end = self._spans[2 * index + 1]
+        if not self._is_str:
+            return self._text[start:end] == string.encode('utf-8')
+        return end - start == len(string) and self._text.startswith(string, start)
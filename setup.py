@@ -6,7 +6,7 @@ setup(name='pt-law-parser',
       description='Parser of the portuguese law',
       author='Jorge C. Leitão',
       author_email='jorgecarleitao@gmail.com',
-      packages=find_packages(),
+      packages=find_packages(exclude=['benchmarks']),
       license='MIT',
       classifiers=[
           'Intended Audience :: Developers',
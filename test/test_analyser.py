@@ -5,8 +5,8 @@ from pt_law_downloader import get_publication
 
 from pt_law_parser.normalizer import normalize
 from pt_law_parser.analyser import analyse
-from pt_law_parser.html import html_toc, valid_html
-from pt_law_parser.expressions import from_json
+from pt_law_parser.html import html_toc, valid_html, iter_valid_html
+from pt_law_parser.expressions import from_json, from_bytes
 from pt_law_parser import parser
 from pt_law_parser.observers import DocumentRefObserver, ArticleRefObserver
 
@@ -44,6 +44,9 @@ class TestCase(unittest.TestCase):
         result = analyse(parse(text))
 
         self.assertEqual(result, from_json(result.as_json()))
+        self.assertEqual(result, from_json(result.as_json(compact=True)))
+        self.assertEqual(result, from_json(result.as_json(), lazy=True))
+        self.assertEqual(result, from_bytes(result.to_bytes()))
 
     def _compare_texts(self, input_file, expected_file):
         file_dir = os.path.dirname(__file__)
@@ -59,7 +62,12 @@ class TestCase(unittest.TestCase):
 
         self.assertEqual(_expected(expected_file),
                          valid_html(result.as_html()))
+        # small chunks split tags between them
+        self.assertEqual(_expected(expected_file),
+                         ''.join(iter_valid_html(result, chunk_size=10)))
         self.assertEqual(normalized, result.as_str())
+        # the sections are slices of the text
+        self.assertIs(normalized, analyse(parse(normalized), normalized).text)
         self.assertEqual(result, from_json(result.as_json()))
         return result
 
@@ -88,6 +96,8 @@ class TestCase(unittest.TestCase):
         self.assertEqual(_expected('%d.html' % publication['dre_id']),
                          valid_html(result.as_html()))
         self.assertEqual(normalized, result.as_str())
+        # the sections are slices of the text
+        self.assertIs(normalized, analyse(parse(normalized), normalized).text)
         self.assertEqual(result, from_json(result.as_json()))
         return result
 
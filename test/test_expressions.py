@@ -1,7 +1,16 @@
+import copy
+import io
+import json
+import pickle
 import unittest
 
+from pt_law_parser import expressions
+from pt_law_parser.analyser import analyse
 from pt_law_parser.expressions import DocumentReference, Token, Anchor, Annex, \
-    EULawReference
+    EULawReference, register_kind, TEXT, NEWLINE, Article, Paragraph, \
+    TitledDocumentSection, Document, QuotationSection, Number, \
+    OrderedDocumentSection, ArticleReference, Reference, from_json, \
+    from_bytes, Chapter, Line, InlineParagraph
 
 
 class TestDocument(unittest.TestCase):
@@ -17,6 +26,333 @@ class TestDocument(unittest.TestCase):
     def test_not_equal(self):
         self.assertNotEqual(Token('bla'), Anchor('bla'))
 
+    def test_hash(self):
+        self.assertEqual(hash(Token('bla')), hash(Token('bla')))
+        self.assertEqual(1, len({Token('bla'), Token('bla'), Anchor('bla')} &
+                                {Token('bla')}))
+
+    def test_section_hash(self):
+        def document(href=''):
+            reference = DocumentReference('1/2000', Token('Lei'), href)
+            section = TitledDocumentSection(
+                Article('1'), None, Paragraph(Token('o '), reference))
+            return Document(section), section, reference
+
+        doc, section, reference = document()
+        self.assertEqual(document()[0], doc)
+        self.assertEqual(hash(document()[0]), hash(doc))
+
+        # changes in any element invalidate the cached hash of the document
+        reference.set_href('http://www.example.com')
+        expected, expected_section, _ = document('http://www.example.com')
+        self.assertEqual(hash(expected), hash(doc))
+        self.assertNotEqual(document()[0], doc)
+
+        section.title = Paragraph(Token('bla'))
+        self.assertNotEqual(expected, doc)
+        expected_section.title = Paragraph(Token('bla'))
+        self.assertEqual(hash(expected), hash(doc))
+        self.assertEqual(expected, doc)
+
+        section.append(Paragraph())
+        self.assertNotEqual(expected, doc)
+        expected_section.append(Paragraph())
+        self.assertEqual(hash(expected), hash(doc))
+
+    def test_write_html(self):
+        doc = Document(Paragraph(Token('a\n'), Paragraph()),
+                       QuotationSection(Paragraph(Token('b'))))
+        self.assertEqual('<p>a</p><blockquote><p>b</p></blockquote>',
+                         doc.as_html())
+
+        sink = []
+        doc.write_html(sink)
+        self.assertEqual(doc.as_html(), ''.join(sink))
+
+        sink = io.StringIO()
+        doc.write_html(sink)
+        self.assertEqual(doc.as_html(), sink.getvalue())
+
+    def test_cached(self):
+        reference = DocumentReference('1/2000', Token('Lei'))
+        number = OrderedDocumentSection(Number('1'), Paragraph(reference))
+        article = TitledDocumentSection(Article('1'), None, number)
+        doc = Document(article)
+        html = doc.as_html()
+        self.assertEqual(html, doc.as_html())
+        self.assertIn('id="Artigo-1-Número-1"', html)
+
+        reference.set_href('http://www.example.com')
+        self.assertEqual(html.replace('<a>', '<a href="http://www.example.com">'),
+                         doc.as_html())
+        self.assertEqual(doc.as_html(), ''.join(doc.iter_html()))
+
+        article.title = Paragraph(Token('bla'))
+        article.append(Paragraph(Token('ble')))
+        self.assertEqual('Artigo 1\nbla1 -1/2000ble', doc.as_str())
+
+        # the ids of the sections depend on where they are
+        other = Document(TitledDocumentSection(Article('2'), None, article))
+        self.assertIn('id="Artigo-2-Artigo-1-Número-1"', other.as_html())
+        self.assertNotIn('id=', QuotationSection(number).as_html())
+
+    def test_id(self):
+        number = OrderedDocumentSection(Number('1'))
+        self.assertEqual('Número-1', number.id_as_html())
+        article = TitledDocumentSection(Article('1'), None, number)
+        self.assertEqual('Artigo-1-Número-1', number.id_as_html())
+        self.assertEqual('#Artigo-1-Número-1', number.anchor.ref_as_href())
+
+        # moving a section changes the ids of the sections in it
+        TitledDocumentSection(Annex(''), None, article)
+        self.assertEqual('Anexo--Artigo-1-Número-1', number.id_as_html())
+        QuotationSection(article)
+        self.assertIsNone(number.id_as_html())
+        self.assertIsNone(number.anchor.ref_as_href())
+
+    def test_find_all(self):
+        law = DocumentReference('1/2000', Token('Lei'))
+        number = OrderedDocumentSection(Number('1'), Paragraph(law))
+        doc = Document(TitledDocumentSection(Article('1'), None, number))
+
+        self.assertEqual([law],
+                         doc.find_all(lambda x: isinstance(x, Reference), True))
+        self.assertEqual([number], list(doc.iter_all(
+            lambda x: isinstance(x, OrderedDocumentSection))))
+        self.assertEqual({('Lei', '1/2000')}, doc.get_doc_refs())
+
+        # the index of the document is kept up to date
+        other = DocumentReference('2/2000', Token('Lei'))
+        number.append(Paragraph(other))
+        self.assertEqual([law, other], doc.find_all_instances(Reference))
+        self.assertEqual(doc.find_all(lambda x: isinstance(x, Paragraph), True),
+                         doc.find_all_instances(Paragraph))
+        doc.set_doc_refs({('Lei', '2/2000'): 'http://www.example.com'})
+        self.assertEqual('http://www.example.com', other._href)
+
+    def test_find_all_instances_order(self):
+        law = DocumentReference('1/2000', Token('Lei'))
+        article = ArticleReference('1º', Token('artigo'))
+        first = TitledDocumentSection(Article('1'), None, Paragraph(law))
+        doc = Document(first, TitledDocumentSection(Article('2'), None,
+                                                    Paragraph(article)))
+
+        # instances of several classes, in the order of the document
+        self.assertEqual([law, article], doc.find_all_instances(Reference))
+
+        # appended to a section before the end of the document
+        other = ArticleReference('2º', Token('artigo'))
+        first.append(Paragraph(other))
+        self.assertEqual([law, other, article],
+                         doc.find_all_instances(Reference))
+        self.assertEqual(doc.find_all(lambda x: isinstance(x, Paragraph), True),
+                         doc.find_all_instances(Paragraph))
+
+        result = pickle.loads(pickle.dumps(doc))
+        self.assertEqual([law, other, article],
+                         result.find_all_instances(Reference))
+
+    def test_get_section(self):
+        line = OrderedDocumentSection(Line('a)'))
+        number = OrderedDocumentSection(Number('2'), line)
+        article = TitledDocumentSection(Article('1-A'), None, number)
+        doc = Document(TitledDocumentSection(Chapter('I'), None, article),
+                       QuotationSection(TitledDocumentSection(Article('2'))))
+
+        self.assertEqual({(Article, '1-A'): article}, doc.child_by_number)
+        self.assertIs(line, doc.get_section('Artigo-1-A-Número-2-Alínea-a)'))
+        self.assertIs(line, doc.get_section(
+            ((Article, '1-A'), (Number, '2'), (Line, 'a)'))))
+        self.assertIs(number, doc.get_section(number.id_as_html()))
+        for path in ('Artigo-2', 'Artigo-1-A-Número-3', 'Capítulo-I', '',
+                     ()):
+            self.assertIsNone(doc.get_section(path))
+
+        # appended sections are found
+        annex = TitledDocumentSection(Annex(''))
+        doc.append(annex)
+        annex.append(TitledDocumentSection(Article('1-A')))
+        self.assertIs(annex.child_by_number[(Article, '1-A')],
+                      doc.get_section('Anexo--Artigo-1-A'))
+
+    def test_get_section_lazy(self):
+        doc = Document(Paragraph(Token('a')), TitledDocumentSection(
+            Article('1'), None, Paragraph(Token('b'))))
+        doc = from_json(doc.as_json(), lazy=True)
+
+        self.assertEqual('Artigo-1', doc.get_section('Artigo-1').id_as_html())
+        paragraph = doc._children[0]
+        self.assertIsNotNone(paragraph._lazy)  # its elements were not built
+
+    def test_span(self):
+        text = 'Artigo 1\nbla\n«c\n»1/2000\n'
+        law = DocumentReference('1/2000', Token('Lei'))
+        tokens = [Article('1'), Token('bla'), Token('\n'), Token('«'),
+                  Token('c'), Token('\n'), Token('»'), law, Token('\n')]
+        doc = analyse(tokens, text)
+        self.assertIs(text, doc.text)
+        self.assertEqual((0, len(text)), doc.span)
+        article = doc.find_all(lambda x: True)[0]
+        self.assertEqual((0, len(text)), article.span)
+        self.assertEqual((9, 13), article.title.span)
+        self.assertEqual('«c\n»', text[slice(*article.find_all(
+            lambda x: isinstance(x, QuotationSection))[0].span)])
+
+        # the text does not change with hrefs
+        doc.set_doc_refs({('Lei', '1/2000'): 'http://www.example.com'})
+        self.assertEqual(text, doc.as_str())
+        self.assertIs(text, doc.text)
+
+        article.append(Paragraph(Token('e')))
+        self.assertIsNone(doc.text)
+        self.assertIsNone(article.span)
+        self.assertEqual((9, 13), article.title.span)
+        self.assertEqual(text + 'e', doc.as_str())
+
+        # only when the document is a lossless view of the text
+        self.assertIsNone(analyse(tokens, text + ' ').text)
+        self.assertIsNone(analyse(tokens).text)
+
+    def test_compact(self):
+        law = DocumentReference('1/2000', Token('Lei'))
+        paragraph = Paragraph(Token('a'), Token(' '), law, Token('\n'),
+                              Token('b'))
+        doc = Document(TitledDocumentSection(Article('1'), Paragraph(
+            Token('c')), paragraph, OrderedDocumentSection(
+                Number('1'), InlineParagraph(Token('d')))))
+        expected = from_bytes(doc.to_bytes())
+
+        doc.compact()
+        self.assertEqual('a 1/2000\nb', paragraph.as_str())
+        self.assertEqual(5, len(paragraph))
+        self.assertEqual(expected, doc)
+        self.assertEqual(expected.as_html(), doc.as_html())
+        self.assertEqual(expected.as_dict(), doc.as_dict())
+        self.assertEqual(expected.to_bytes(), doc.to_bytes())
+        self.assertEqual([Token('a'), Token(' '), law, Token('\n'),
+                          Token('b')], paragraph.find_all(lambda x: True))
+        self.assertEqual([law], doc.find_all_instances(DocumentReference))
+        self.assertIsNotNone(paragraph._lazy)  # still compact
+
+        # references are kept, and it is built again when changed
+        law.set_href('http://www.example.com')
+        self.assertIn('<a href="http://www.example.com">', doc.as_html())
+        paragraph.append(Token('e'))
+        self.assertEqual('a 1/2000\nbe', paragraph.as_str())
+        self.assertIsNone(paragraph._lazy)
+
+    def test_compact_pickle(self):
+        law = DocumentReference('1/2000', Token('Lei'))
+        doc = Document(TitledDocumentSection(Article('1'), None, Paragraph(
+            Token('a'), Token(' '), law)))
+        doc.compact()
+
+        result = pickle.loads(pickle.dumps(doc))
+        paragraph = result.find_all_instances(Paragraph)[0]
+        self.assertIsNotNone(paragraph._lazy)  # still compact
+        self.assertEqual(doc, result)
+        self.assertEqual(doc.as_html(), result.as_html())
+        self.assertEqual([law], result.find_all_instances(DocumentReference))
+
+        paragraph = copy.copy(paragraph)
+        self.assertIsNotNone(paragraph._lazy)
+        self.assertEqual('a 1/2000', paragraph.as_str())
+
+    def test_bytes(self):
+        law = DocumentReference('1/2000', Token('Lei'), 'http://www.example.com')
+        doc = Document(
+            TitledDocumentSection(Article('1'), Paragraph(Token('Bla')),
+                                  Paragraph(Token('o '), law)),
+            TitledDocumentSection(Article('2'), None, QuotationSection(
+                Paragraph(ArticleReference('1', law), Token('o '))),
+                OrderedDocumentSection(Number('1'))))
+
+        result = from_bytes(doc.to_bytes())
+        self.assertEqual(doc, result)
+        self.assertEqual(from_json(doc.as_json()), result)
+        self.assertEqual(doc.as_html(), result.as_html())
+        # equal tokens are shared
+        tokens = result.find_all(lambda x: type(x) == Token, True)
+        self.assertEqual(2, len(tokens))
+        self.assertIs(tokens[0], tokens[1])
+
+        self.assertRaises(ValueError, from_bytes, b'{"Token": ["bla"]}')
+
+    def test_bytes_malformed(self):
+        law = DocumentReference('1/2000', Token('Lei'), 'http://www.example.com')
+        data = Document(TitledDocumentSection(
+            Article('1'), Paragraph(Token('Bla')), Paragraph(Token('o '), law))
+        ).to_bytes()
+
+        for end in range(len(data)):
+            self.assertRaises(ValueError, from_bytes, data[:end])
+        self.assertRaises(ValueError, from_bytes, data + b'\x00')
+
+        # only classes of elements are read
+        for name in (b'Documenu', b'_Index', b'from_bytes', b'BaseElement'):
+            self.assertRaises(ValueError, from_bytes, data.replace(
+                b'\x08Document', bytes([len(name)]) + name))
+        self.assertRaises(ValueError, from_bytes, data.replace(b'Paragraph',
+                                                               b'Paragrap\xff'))
+
+    def test_json(self):
+        law = DocumentReference('1/2000', Token('Lei'), 'http://www.example.com')
+        doc = Document(
+            TitledDocumentSection(Article('1'), Paragraph(Token('Artigo')),
+                                  Paragraph(Token('o '), law)),
+            TitledDocumentSection(Article('2'), None, QuotationSection(
+                Paragraph(ArticleReference('1', law), Token('ç'))),
+                OrderedDocumentSection(Number('1'))))
+
+        self.assertEqual(json.dumps(doc.as_dict()), doc.as_json())
+        sink = io.StringIO()
+        doc.write_json(sink)
+        self.assertEqual(doc.as_json(), sink.getvalue())
+
+        compact = doc.as_json(compact=True)
+        self.assertLess(len(compact), len(doc.as_json()))
+        self.assertEqual(doc, from_json(compact))
+        sink = []
+        doc.write_json(sink, compact=True)
+        self.assertEqual(compact, ''.join(sink))
+
+    def test_lazy_json(self):
+        doc = Document(
+            TitledDocumentSection(Article('1'), Paragraph(Token('Artigo')),
+                                  Paragraph(Token('o '), Token('a'))),
+            TitledDocumentSection(Article('2'), Paragraph(Token('c')),
+                                  OrderedDocumentSection(
+                                      Number('1'), Paragraph(Token('b')))))
+
+        for data in (doc.as_json(), doc.as_json(compact=True)):
+            lazy = from_json(data, lazy=True)
+            article = lazy.find_all(lambda x: True)[0]
+            self.assertEqual('Artigo 1\nArtigo', article.anchor.as_str() +
+                             article.title.as_str())
+            self.assertIsNotNone(article._lazy)  # its elements are not decoded
+
+            self.assertEqual(doc, lazy)
+            self.assertIsNone(article._lazy)
+            lazy = from_json(data, lazy=True)
+            self.assertEqual(doc.as_html(), lazy.as_html())
+
+    def test_kind(self):
+        self.assertEqual(NEWLINE, Token('\n').kind)
+        self.assertEqual(TEXT, Token('bla').kind)
+        self.assertEqual(TEXT, Anchor('\n').kind)
+
+        kind = register_kind('Despacho')
+        self.assertEqual(kind, register_kind('Despacho'))
+        self.assertEqual(kind, Token('Despacho').kind)
+        self.assertNotIn(kind, (TEXT, NEWLINE))
+
+    def test_slots(self):
+        # all elements must define `__slots__`, or they get a `__dict__` again
+        for name in dir(expressions):
+            klass = getattr(expressions, name)
+            if isinstance(klass, type) and issubclass(klass, expressions.BaseElement):
+                self.assertIn('__slots__', klass.__dict__, name)
+
     def test_annex(self):
         self.assertEqual('Anexo I\n', Annex('I').as_str())
         self.assertEqual('Anexo\n', Annex('').as_str())
@@ -1,5 +1,7 @@
+import pickle
 import unittest
 
+from pt_law_parser import analyse, analyser
 from pt_law_parser.expressions import Token, DocumentReference, ArticleReference, \
     NumberReference, LineReference, Article, Number, Line, EULawReference, Annex, \
     Clause, Item
@@ -7,8 +9,9 @@ from pt_law_parser import parser
 from pt_law_parser.parser import ObserverManager
 from pt_law_parser.observers import DocumentRefObserver, NumberRefObserver, \
     LineRefObserver, ArticleRefObserver, EULawRefObserver, UnnumberedAnnexObserver, \
-    ClauseObserver
-from pt_law_parser.normalizer import replace_eu_links
+    ClauseObserver, ArticleObserver
+from pt_law_parser.normalizer import replace_eu_links, normalize, \
+    uppercase_spellings
 
 
 class GeneralTestCase(unittest.TestCase):
@@ -323,6 +326,106 @@ class TestAnnex(GeneralTestCase):
         self.assertEqual([Token('\n'), Token('Título'), Token('\n')], result)
 
 
+class TestParseMany(unittest.TestCase):
+    def test_many(self):
+        managers = [ObserverManager({'Decreto-Lei': DocumentRefObserver}),
+                    ObserverManager({'artigo': ArticleRefObserver})]
+        strings = ['Decreto-Lei nº 2/2013.', 'o artigo 2º do Decreto-Lei 2/2013,']
+        terms = {' ', '.', ','}
+
+        self.assertEqual([parser.parse(string, managers, terms)
+                          for string in strings],
+                         parser.parse_many(strings, managers, terms))
+
+    def test_tokenizer(self):
+        managers = [ObserverManager({'Decreto-Lei': DocumentRefObserver}),
+                    ObserverManager({'artigo': ArticleRefObserver})]
+        strings = ['Decreto-Lei nº 2/2013.', 'o artigo 2º do Decreto-Lei 2/2013,']
+        terms = {' ', '.', ','}
+
+        # e.g. sent to a worker process
+        tokenizer = pickle.loads(pickle.dumps(
+            parser.get_tokenizer(parser._terms(managers, terms))))
+        self.assertEqual(parser.parse(strings[1], managers, terms),
+                         parser.parse(strings[1], managers, tokenizer=tokenizer))
+        self.assertEqual(parser.parse_many(strings, managers, terms),
+                         parser.parse_many(strings, managers,
+                                           tokenizer=tokenizer))
+
+
+class TestSpellings(unittest.TestCase):
+    def test_uppercase(self):
+        managers = parser.common_managers
+        terms = {' ', '.', ',', '\n'}
+        html = '<p>ANEXOS</p><p>ARTIGO 1.º - Bla</p><p>CAPÍTULO I</p>' \
+               '<p>PARTES, TÍTULOS e ARTIGOS</p><p>Texto</p>'
+
+        normalized = normalize(html, fold_case=False)
+        self.assertIn('ANEXOS', normalized)
+
+        expected = parser.parse(normalize(html), managers, terms)
+        result = parser.parse(normalized, managers, terms, uppercase_spellings())
+        self.assertEqual(expected, result)
+        self.assertEqual([e.as_str() for e in expected],
+                         [e.as_str() for e in result])
+        self.assertIn(Token('AnexoS'), result)
+        self.assertIn(Article('1º'), result)
+
+        # and so are the documents analysed from them
+        self.assertEqual(analyser.analyse(list(expected)).as_json(),
+                         analyser.analyse(result).as_json())
+
+    def test_not_keyterms(self):
+        managers = parser.common_managers
+        terms = {' ', '.', ',', '\n'}
+        html = '<p>ANEXO</p><p>As Partes do Anexo</p><p>PARTE I</p>'
+
+        expected = parser.parse(normalize(html), managers, terms)
+        result = parser.parse(normalize(html, fold_case=False), managers, terms,
+                              uppercase_spellings())
+        self.assertEqual(expected, result)
+        self.assertIn(Token('Partes'), result)
+
+    def test_analyse(self):
+        managers = parser.common_managers
+        terms = {' ', '.', ',', '\n'}
+        html = '<p>ANEXO</p><p>ARTIGO 1.º - As Partes</p><p>CAPÍTULO I</p>' \
+               '<p>Anexos e PARTES</p>'
+
+        text = normalize(html)
+        tokens = parser.parse(text, managers, terms)
+        expected = analyser.analyse(list(tokens), text)
+        result = analyse(html, managers, terms)
+
+        # the json has the tokens of each paragraph
+        self.assertEqual(expected.as_json(), result.as_json())
+        self.assertIn(Token('Anexos'), tokens)
+        self.assertEqual(text, result.text)
+
+
+class TestActiveManagers(unittest.TestCase):
+    def test_can_replace(self):
+        manager = ObserverManager({'\n': ArticleObserver})
+        terms = {' ', '\n'}
+
+        stream = parser.tokenize_stream('\nArtigo 1º\n', parser.get_tokenizer(terms))
+        self.assertEqual([manager], parser._active_managers([manager], stream))
+
+        stream = parser.tokenize_stream('\nArtigos 1º\n', parser.get_tokenizer(terms))
+        self.assertEqual([], parser._active_managers([manager], stream))
+
+        stream = parser.tokenize_stream('Artigo 1º', parser.get_tokenizer(terms))
+        self.assertEqual([], parser._active_managers([manager], stream))
+
+
+class TestTokenizerCache(unittest.TestCase):
+    def test_same_terms(self):
+        self.assertIs(parser.get_tokenizer({' ', '\n'}),
+                      parser.get_tokenizer(['\n', ' ']))
+        self.assertIsNot(parser.get_tokenizer({' ', '\n'}),
+                         parser.get_tokenizer({' '}))
+
+
 class TestNormalizer(unittest.TestCase):
 
     def test_law(self):
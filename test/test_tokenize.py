@@ -1,7 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import mmap
+import multiprocessing
+import pickle
+import tempfile
+import types
 import unittest
 
-from pt_law_parser.expressions import Token
-from pt_law_parser.tokenizer import tokenize
+from pt_law_parser.expressions import Token, register_kind, TEXT, SPACE, DOT
+from pt_law_parser.tokenizer import tokenize, tokenize_many, tokenize_spans, \
+    iter_tokenize, tokenize_stream, tokenize_stream_many, intern_token, \
+    case_spellings, MAX_INTERNED_LENGTH, Tokenizer, StreamTokenizer
+
+
+def _stream_kinds(tokenizer, string):
+    # run in another process, with its own registry of kinds
+    return list(tokenize_stream(string, tokenizer).kinds), register_kind(string)
 
 
 class TestCase(unittest.TestCase):
@@ -146,3 +159,292 @@ class TestCase(unittest.TestCase):
              Token(' '), Token('Decreto-Lei'), Token(' '),
              Token('2/2013'), Token(',')]
         )
+
+    def test_keyterm_after_partial_keyterm(self):
+        """
+        A failed partial match must not hide a keyterm that starts inside it.
+        """
+        self.assertEqual(
+            list(tokenize('LLei 2', (' ', 'Lei'))),
+            [Token('L'), Token('Lei'), Token(' '), Token('2')])
+
+        self.assertEqual(
+            list(tokenize('Regulamento Regulamento CE', (' ', 'Regulamento CE'))),
+            [Token('Regulamento'), Token(' '), Token('Regulamento CE')])
+
+    def test_many_keyterms(self):
+        keyterms = [' '] + ['Tipo %d' % i for i in range(500)] + ['Portaria']
+        self.assertEqual(
+            list(tokenize('a Portaria nº 2', keyterms)),
+            [Token('a'), Token(' '), Token('Portaria'), Token(' '),
+             Token('nº'), Token(' '), Token('2')])
+
+    def test_many(self):
+        strings = ['the end is', 'is the end', '']
+        keyterms = (' ', 'the end')
+
+        self.assertEqual([tokenize(string, keyterms) for string in strings],
+                         tokenize_many(strings, keyterms))
+        self.assertEqual(tokenize_many(strings, keyterms),
+                         tokenize_many(iter(strings), Tokenizer(keyterms)))
+
+
+class TestTokenizer(unittest.TestCase):
+
+    def test_tokenize(self):
+        tokenizer = Tokenizer((' ', 'the end'))
+
+        self.assertEqual(tokenize('the end is', tokenizer),
+                         [Token('the end'), Token(' '), Token('is')])
+        self.assertEqual(tokenize('is the end', tokenizer),
+                         [Token('is'), Token(' '), Token('the end')])
+
+    def test_threads(self):
+        tokenizer = Tokenizer((' ', '.', 'Decreto-Lei', 'n.º', '.º'))
+        strings = ['o Decreto-Lei n.º %d/2013.' % i for i in range(100)]
+
+        with ThreadPoolExecutor(4) as executor:
+            result = list(executor.map(tokenizer.tokenize, strings))
+
+        self.assertEqual([tokenizer.tokenize(string) for string in strings],
+                         result)
+
+    def test_stats(self):
+        tokenizer = Tokenizer((' ', 'Decreto', 'Decreto-Lei'))
+
+        tokens, stats = tokenizer.tokenize('o Decreto-Lei e', stats=True)
+
+        self.assertEqual(tokenizer.tokenize('o Decreto-Lei e'), tokens)
+        self.assertEqual(15, stats['bytes'])
+        self.assertEqual(len(tokens), stats['tokens'])
+        # ' ' twice, 'Decreto' and 'Decreto-Lei'
+        self.assertEqual(4, stats['matches'])
+        self.assertEqual(2, stats['peak_matches'])
+        self.assertEqual(0, stats['prefixes'])
+
+    def test_pickle(self):
+        tokenizer = pickle.loads(pickle.dumps(Tokenizer((' ', 'the end'))))
+
+        self.assertEqual((' ', 'the end'), tokenizer.keyterms)
+        self.assertEqual(tokenize('the end is', tokenizer),
+                         [Token('the end'), Token(' '), Token('is')])
+
+
+class TestInternToken(unittest.TestCase):
+
+    def test_shared(self):
+        tokens = tokenize('a . b . a', (' ', '.'))
+        other = tokenize_many(['b .'], (' ', '.'))[0]
+
+        self.assertIs(tokens[1], tokens[3])
+        self.assertIs(tokens[0], tokens[8])
+        self.assertIs(tokens[4], other[0])
+        self.assertIs(tokens[2], other[2])
+        self.assertIs(tokens[2], tokenize_spans('a .', (' ', '.'))[2])
+        self.assertIs(tokens[2], list(iter_tokenize(['a', ' .'], (' ', '.')))[2])
+
+    def test_bounded(self):
+        string = 'a' * (MAX_INTERNED_LENGTH + 1)
+
+        self.assertIsNot(intern_token(string), intern_token(string))
+        self.assertEqual(intern_token(string), intern_token(string))
+
+
+class TestTokenStream(unittest.TestCase):
+
+    def test_kinds(self):
+        stream = tokenize_stream('a Lei. b', (' ', '.', 'Lei'))
+
+        self.assertEqual(tokenize('a Lei. b', (' ', '.', 'Lei')), list(stream))
+        self.assertEqual([TEXT, SPACE, register_kind('Lei'), DOT, SPACE, TEXT],
+                         list(stream.kinds))
+        self.assertEqual([token.kind for token in stream], list(stream.kinds))
+
+    def test_tokenizer(self):
+        tokenizer = Tokenizer((' ', 'Lei'), (SPACE, 100))
+
+        self.assertEqual([TEXT, SPACE, 100],
+                         list(tokenize_stream('a Lei', tokenizer).kinds))
+        self.assertEqual([[100], [TEXT]],
+                         [list(stream.kinds) for stream in
+                          tokenize_stream_many(['Lei', b'a'], tokenizer)])
+        self.assertEqual((SPACE, 100), pickle.loads(pickle.dumps(tokenizer)).kinds)
+        self.assertRaises(ValueError, Tokenizer, (' ', 'Lei'), (SPACE,))
+
+    def test_registered_kinds_pickle(self):
+        for i in range(10):
+            register_kind('Outro termo %d' % i)
+        tokenizer = Tokenizer((' ', 'Portaria conjunta'), register_kind)
+        self.assertEqual((SPACE, register_kind('Portaria conjunta')),
+                         tokenizer.kinds)
+
+        # the kinds are registered again in the process it is sent to
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            kinds, kind = executor.submit(
+                _stream_kinds, tokenizer, 'Portaria conjunta').result()
+        self.assertEqual([kind], kinds)
+        self.assertNotEqual(register_kind('Portaria conjunta'), kind)
+
+    def test_register_kind_threads(self):
+        strings = ['Termo %d' % i for i in range(200)]
+        with ThreadPoolExecutor(8) as executor:
+            kinds = list(executor.map(register_kind, strings * 4))
+
+        self.assertEqual(kinds[:200] * 4, kinds)
+        self.assertEqual(200, len(set(kinds[:200])))
+
+
+class TestSpellings(unittest.TestCase):
+
+    def test_canonical(self):
+        tokenizer = Tokenizer((' ', 'Artigo', 'artigo'),
+                              spellings={'Artigo': ['ARTIGO', 'artigo']})
+
+        # the keyterm 'artigo' takes precedence over the spelling of 'Artigo'
+        self.assertEqual(['Artigo', ' ', 'artigo', ' ', 'Artigo', 'S'],
+                         tokenizer.tokenize('ARTIGO artigo ARTIGOS'))
+        self.assertEqual(['Artigo'], tokenize_stream('ARTIGO', tokenizer).strings)
+        self.assertEqual([2], list(tokenize_stream('ARTIGO', tokenizer).kinds))
+
+    def test_keep_spelling(self):
+        tokenizer = Tokenizer((' ', 'Artigo'), spellings={'Artigo': ['ARTIGO']},
+                              keep_spelling=True)
+
+        self.assertEqual(['ARTIGO', ' ', 'Artigo'],
+                         tokenizer.tokenize('ARTIGO Artigo'))
+        self.assertEqual([2], list(tokenize_stream('ARTIGO', tokenizer).kinds))
+
+        tokenizer = pickle.loads(pickle.dumps(tokenizer))
+        self.assertEqual(['ARTIGO'], tokenizer.tokenize('ARTIGO'))
+
+    def test_not_keyterm(self):
+        # spellings of a term that is not a keyterm do not make it one
+        tokenizer = Tokenizer((' ',), (SPACE,), spellings={'Parte': ['PARTE']})
+
+        self.assertEqual((' ',), tokenizer.keyterms)
+        self.assertEqual(['Parte', ' ', 'Partes'], tokenizer.tokenize('PARTE Partes'))
+        stream = tokenize_stream('PARTE I', tokenizer)
+        self.assertEqual(['Parte', ' ', 'I'], stream.strings)
+        self.assertEqual([TEXT, SPACE, TEXT], list(stream.kinds))
+
+        # replaced inside the text around it, as the normalizer would do
+        string = 'PARTES xPARTEPARTE'
+        self.assertEqual(['ParteS', ' ', 'xParteParte'], tokenizer.tokenize(string))
+        self.assertEqual([TEXT, SPACE, TEXT],
+                         list(tokenize_stream(string, tokenizer).kinds))
+        self.assertEqual([0, 6, 6, 7, 7, 18],
+                         list(tokenize_spans(string, tokenizer).spans))
+        for i in range(len(string) + 1):
+            self.assertEqual(
+                tokenize(string, tokenizer),
+                list(iter_tokenize([string[:i], string[i:]], tokenizer)))
+
+    def test_mapping(self):
+        spellings = types.MappingProxyType({'Artigo': ['ARTIGO']})
+        tokenizer = Tokenizer((' ', 'Artigo'), spellings=spellings)
+
+        self.assertEqual(['Artigo', ' '], tokenizer.tokenize('ARTIGO '))
+        tokenizer = pickle.loads(pickle.dumps(tokenizer))
+        self.assertEqual(['Artigo'], tokenizer.tokenize('ARTIGO'))
+
+    def test_case_spellings(self):
+        self.assertEqual(['ÉS', 'És', 'éS', 'és'], case_spellings('és'))
+        self.assertEqual(['1A', '1a'], case_spellings('1a'))
+        self.assertRaises(ValueError, case_spellings, 'a' * 13)
+
+        tokenizer = Tokenizer((' ', 'Secção'),
+                              spellings={'Secção': case_spellings('Secção')})
+        self.assertEqual(['Secção', ' ', 'Secção'],
+                         tokenizer.tokenize('SECÇÃO sEcÇãO'))
+
+
+class TestTokenSpans(unittest.TestCase):
+
+    def test_spans(self):
+        tokens = tokenize_spans('no n.º 2 ção', (' ', 'n.º', '.º'))
+
+        self.assertEqual([0, 2, 2, 3, 3, 6, 6, 7, 7, 8, 8, 9, 9, 12],
+                         list(tokens.spans))
+        self.assertEqual(7, len(tokens))
+        self.assertEqual('n.º', tokens.as_str(2))
+        self.assertEqual('ção', tokens.as_str(6))
+        self.assertEqual(list(tokenize('no n.º 2 ção', (' ', 'n.º', '.º'))),
+                         list(tokens))
+
+    def test_equals(self):
+        tokens = tokenize_spans('a . b', (' ', '.'))
+
+        self.assertTrue(tokens.equals(2, '.'))
+        self.assertFalse(tokens.equals(2, ' '))
+        self.assertFalse(tokens.equals(0, 'a .'))
+        self.assertEqual(Token('.'), tokens[2])
+
+
+class TestBuffers(unittest.TestCase):
+
+    string = 'no n.º 2 da ção'
+    keyterms = (' ', 'n.º', '.º', 'ção')
+
+    def test_tokenize(self):
+        expected = tokenize(self.string, self.keyterms)
+        data = self.string.encode('utf-8')
+
+        for text in (data, bytearray(data), memoryview(data)):
+            self.assertEqual(expected, tokenize(text, self.keyterms))
+        self.assertEqual([expected, expected],
+                         tokenize_many([data, self.string], self.keyterms))
+
+    def test_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(self.string.encode('utf-8'))
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text:
+                self.assertEqual(tokenize(self.string, self.keyterms),
+                                 tokenize(text, self.keyterms))
+
+    def test_spans(self):
+        tokens = tokenize_spans(self.string.encode('utf-8'), self.keyterms)
+
+        # offsets in bytes
+        self.assertEqual([0, 2, 2, 3, 3, 7], list(tokens.spans[:6]))
+        self.assertEqual('ção', tokens.as_str(8))
+        self.assertTrue(tokens.equals(8, 'ção'))
+        self.assertFalse(tokens.equals(8, 'cão'))
+        self.assertEqual(tokenize(self.string, self.keyterms), list(tokens))
+
+    def test_chunks(self):
+        data = self.string.encode('utf-8')
+        expected = tokenize(self.string, self.keyterms)
+
+        # chunks split inside multi-byte characters
+        for i in range(len(data) + 1):
+            self.assertEqual(expected, list(iter_tokenize([data[:i], data[i:]],
+                                                          self.keyterms)))
+
+    def test_invalid(self):
+        self.assertRaises(UnicodeDecodeError, tokenize, b'a \xff', (' ',))
+
+
+class TestIterTokenize(unittest.TestCase):
+
+    def test_chunks(self):
+        string = 'no n.º 2 do artigo 26.º do Decreto-Lei 2/2013,'
+        keyterms = (' ', '.', ',', 'Decreto-Lei', 'Decretos-Leis', 'n.º', '.º')
+        expected = tokenize(string, keyterms)
+
+        # keyterms split at every possible position
+        for i in range(len(string) + 1):
+            chunks = [string[:i], string[i:]]
+            self.assertEqual(expected, list(iter_tokenize(chunks, keyterms)))
+
+        self.assertEqual(expected, list(iter_tokenize(string, keyterms)))
+
+    def test_yields_early(self):
+        stream = StreamTokenizer(Tokenizer((' ', 'Decreto', 'Decreto-Lei')))
+
+        self.assertEqual(['o', ' '], stream.feed('o Decre'))
+        self.assertEqual([], stream.feed('to-'))
+        self.assertEqual(['Decreto', '-Barro', ' '], stream.feed('Barro s'))
+        self.assertEqual(['s'], stream.close())
+        self.assertRaises(ValueError, stream.feed, 'a')